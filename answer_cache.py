@@ -0,0 +1,120 @@
+import concurrent.futures
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_EXCLUDE_WORDS,
+    ANSWER_CACHE_MIN_WORDS,
+    ANSWER_CACHE_FOLLOW_UP_STARTS,
+    ANSWER_CACHE_LOOKUP_TIMEOUT,
+)
+from memory_index import embed_query
+
+FILLER_WORDS = {"please", "hey", "ok", "okay", "so", "um", "uh", "assistant", "can", "could", "you", "tell", "me"}
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and filler words, and collapse whitespace."""
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+class AnswerCache:
+    def __init__(self):
+        """Answers to earlier offline questions, matched by normalized text or meaning.
+
+        A lookup first tries the normalized text, then the most similar stored
+        question by embedding (cosine similarity of at least
+        ANSWER_CACHE_SIMILARITY). Entries expire after ANSWER_CACHE_TTL_SECONDS
+        and the least recently used are evicted past ANSWER_CACHE_MAX_ENTRIES.
+        Answers are kept as the chunks they were streamed in, so a replay is
+        split into the same spoken segments and its audio comes from the TTS
+        cache.
+        """
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()  # normalized query -> entry
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cacheable(query: str) -> bool:
+        """False for questions whose answer depends on when they are asked or on earlier turns."""
+        words = re.findall(r"\w+", query.lower())
+        if not words or words[0] in ANSWER_CACHE_FOLLOW_UP_STARTS or " ".join(words[:2]) in ANSWER_CACHE_FOLLOW_UP_STARTS:
+            return False
+        normalized = normalize_query(query).split()
+        if set(normalized) & ANSWER_CACHE_EXCLUDE_WORDS:
+            return False
+        # "Tell me more", "Yes", "Why?": too little of their own to be answered out of context.
+        # Stopwords still count, so "What can you do?" and "Define entropy" are cached.
+        return len(normalized) >= ANSWER_CACHE_MIN_WORDS
+
+    def _embed(self, query: str, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        try:
+            return embed_query(query, timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            print("[CACHE] Embedding took too long, using exact matches only")
+            return None
+        except Exception as e:
+            print(f"[CACHE] Embedding failed, using exact matches only: {e}")
+            return None
+
+    def lookup(self, query: str) -> Optional[List[str]]:
+        """Return the streamed chunks of a cached answer to the query, or None."""
+        key = normalize_query(query)
+        if not key or not self.cacheable(query):
+            return None
+
+        now = time.monotonic()
+        with self.lock:
+            for expired in [k for k, e in self.entries.items() if e["expires_at"] < now]:
+                del self.entries[expired]
+            keys = [] if key in self.entries else [k for k, e in self.entries.items() if e["vector"] is not None]
+            vectors = np.stack([self.entries[k]["vector"] for k in keys]) if keys else None
+
+        if vectors is not None:
+            # Runs before every answer, so it must not wait long for a busy Ollama
+            query_vector = self._embed(query, ANSWER_CACHE_LOOKUP_TIMEOUT)
+            if query_vector is not None:
+                scores = vectors @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= ANSWER_CACHE_SIMILARITY:
+                    print(f"[CACHE] Similar question found ({scores[best]:.2f}): {keys[best]}")
+                    key = keys[best]
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["chunks"]
+
+    def store(self, query: str, chunks: List[str]) -> None:
+        """Remember an offline answer to the query, as the chunks it was streamed in."""
+        key = normalize_query(query)
+        if not key or not "".join(chunks).strip() or not self.cacheable(query):
+            return
+        vector = self._embed(query)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {
+                "query": query,
+                "chunks": list(chunks),
+                "vector": vector,
+                "expires_at": time.monotonic() + ANSWER_CACHE_TTL_SECONDS,
+            }
+            while len(self.entries) > ANSWER_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,62 @@
+import numpy as np
+from typing import Optional
+
+class AudioBuffer:
+    def __init__(self, initial_seconds: float, sample_rate: int):
+        """Preallocated, growable int16 sample buffer for a single recording.
+
+        Captured chunks are copied straight into one contiguous array, so the
+        recording never exists as a list of byte strings and can be handed to
+        Whisper with a single int16 -> float32 conversion.
+        """
+        self.sample_rate = sample_rate
+        self._data = np.zeros(max(int(initial_seconds * sample_rate), 1), dtype=np.int16)
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def duration(self) -> float:
+        """Length of the buffered audio in seconds."""
+        return self._length / self.sample_rate
+
+    def clear(self) -> None:
+        """Drop all samples while keeping the allocated capacity."""
+        self._length = 0
+
+    def _grow(self, required: int) -> None:
+        """Double the capacity until it can hold the required number of samples."""
+        capacity = len(self._data)
+        while capacity < required:
+            capacity *= 2
+        data = np.zeros(capacity, dtype=np.int16)
+        data[:self._length] = self._data[:self._length]
+        # Swap in the new array before readers can see the new length
+        self._data = data
+
+    def append(self, chunk) -> None:
+        """Append raw int16 bytes or an int16 array."""
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            samples = np.frombuffer(chunk, dtype=np.int16)
+        else:
+            samples = np.asarray(chunk, dtype=np.int16)
+
+        end = self._length + len(samples)
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._length:end] = samples
+        self._length = end
+
+    def view(self) -> np.ndarray:
+        """Return a read-only int16 view of the buffered samples without copying."""
+        length = self._length
+        view = self._data[:length]
+        view.flags.writeable = False
+        return view
+
+    def to_float32(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Return samples in [start, end) as float32 in [-1, 1], as Whisper expects."""
+        samples = self.view()[start:end].astype(np.float32)
+        samples *= 1.0 / 32768.0
+        return samples
@@ -0,0 +1,128 @@
+import threading
+import numpy as np
+import pyaudio
+from typing import Callable, Dict, Optional
+
+class RingBuffer:
+    def __init__(self, capacity: int):
+        """Single-producer/single-consumer int16 ring buffer.
+
+        The producer only advances the write index and the consumer only
+        advances the read index, so no lock is needed between the audio
+        callback and the consumer thread. When the consumer falls behind,
+        incoming samples that do not fit are dropped and counted.
+        """
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._write_index = 0  # Total samples ever written
+        self._read_index = 0   # Total samples ever read
+        self.dropped_samples = 0
+
+    def available(self) -> int:
+        """Number of samples waiting to be read."""
+        return self._write_index - self._read_index
+
+    def write(self, samples: np.ndarray) -> int:
+        """Write samples, dropping whatever does not fit. Returns samples written."""
+        free = self.capacity - (self._write_index - self._read_index)
+        count = min(len(samples), free)
+        if count < len(samples):
+            self.dropped_samples += len(samples) - count
+
+        start = self._write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:count - first] = samples[first:count]
+        self._write_index += count
+        return count
+
+    def read(self, max_samples: Optional[int] = None) -> np.ndarray:
+        """Read and consume up to max_samples (all available by default)."""
+        count = self.available()
+        if max_samples is not None:
+            count = min(count, max_samples)
+
+        start = self._read_index % self.capacity
+        first = min(count, self.capacity - start)
+        out = np.empty(count, dtype=np.int16)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:count - first]
+        self._read_index += count
+        return out
+
+class AudioCapture:
+    def __init__(self, audio: pyaudio.PyAudio, sample_rate: int, channels: int,
+                 chunk_size: int, ring_seconds: float):
+        """Callback-driven microphone capture into a lock-free ring buffer.
+
+        PortAudio calls the stream callback from its own thread, so audio
+        keeps flowing while the hotkey handler is busy with transcription
+        or the LLM. A consumer thread drains the ring and forwards chunks
+        to the registered handler.
+        """
+        self.audio = audio
+        self.chunk_size = chunk_size
+        self.ring = RingBuffer(int(sample_rate * ring_seconds))
+        self.input_overflows = 0
+        self.callbacks = 0
+
+        self._data_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._handler: Optional[Callable[[np.ndarray], None]] = None
+        self._consumer: Optional[threading.Thread] = None
+
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=sample_rate,
+            input=True,
+            frames_per_buffer=chunk_size,
+            stream_callback=self._callback,
+            start=False
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """PortAudio callback: copy the chunk into the ring and wake the consumer."""
+        self.callbacks += 1
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        self._data_event.set()
+        return None, pyaudio.paContinue
+
+    def start(self, handler: Callable[[np.ndarray], None]) -> None:
+        """Start the stream and forward every captured chunk to handler."""
+        self._handler = handler
+        self._consumer = threading.Thread(target=self._consume, daemon=True)
+        self._consumer.start()
+        self.stream.start_stream()
+
+    def _consume(self) -> None:
+        """Drain the ring buffer whenever the callback signals new data."""
+        while not self._stop_event.is_set():
+            self._data_event.wait(timeout=0.5)
+            self._data_event.clear()
+            while self.ring.available() >= self.chunk_size:
+                try:
+                    self._handler(self.ring.read(self.chunk_size))
+                except Exception as e:
+                    print(f"[AUDIO] Error handling captured audio: {e}")
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return capture counters, including overruns on both sides of the ring."""
+        return {
+            "callbacks": self.callbacks,
+            "input_overflows": self.input_overflows,
+            "dropped_samples": self.ring.dropped_samples,
+            "buffered_samples": self.ring.available(),
+        }
+
+    def stop(self) -> None:
+        """Stop the stream and the consumer thread."""
+        self._stop_event.set()
+        self._data_event.set()
+        if self._consumer is not None:
+            self._consumer.join(timeout=1.0)
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
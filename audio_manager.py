@@ -1,87 +1,220 @@
 import os
 import tempfile
-import subprocess
 import pyaudio
 import wave
-import whisper
 import warnings
-from typing import List, Optional, Tuple
+import threading
+import numpy as np
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple, Union
 import time
 
-from config import SAMPLE_RATE, CHANNELS, FRAME_DURATION_MS
+from config import (
+    SAMPLE_RATE, CHANNELS, FRAME_DURATION_MS, STREAMING_STT,
+    RECORDING_BUFFER_SECONDS, DEBUG_SAVE_RECORDINGS, CAPTURE_RING_SECONDS,
+    VAD_ENABLED, VAD_AUTO_STOP, BARGE_IN_ENABLED, BARGE_IN_ECHO_TAIL_MS, BARGE_IN_PREROLL_MS,
+)
 from ui_manager import UIManager
+from stt_backends import STTBackend, BackgroundLoadedBackend
+from audio_buffer import AudioBuffer
+from audio_capture import AudioCapture
+from streaming_stt import StreamingTranscriber
+from vad import Endpointer, BargeInDetector
+from tts_engine import TTSEngine
+from tracing import tracer
 
 # Suppress unnecessary warnings
 warnings.filterwarnings("ignore", message="You are using `torch.load` with `weights_only=False`")
 warnings.filterwarnings("ignore", message="Performing inference on CPU when CUDA is available")
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
 
+class Recording:
+    def __init__(self, audio: Optional[np.ndarray], start: int, streamer: Optional[StreamingTranscriber]):
+        """A finished recording, copied out of the buffers the next recording reuses.
+
+        audio holds the speech as float32 samples starting at sample start of
+        the recording, or None if no speech was detected. streamer is the
+        recording's streaming transcriber, already reading from this copy.
+        """
+        self.audio = audio
+        self.start = start
+        self.streamer = streamer
+
+    def get_audio(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Return speech samples in [start, end), indexed like the original recording."""
+        return self.audio[max(start - self.start, 0):None if end is None else max(end - self.start, 0)]
+
+    def speech_bounds(self) -> Optional[Tuple[int, int]]:
+        if self.audio is None:
+            return None
+        return self.start, self.start + len(self.audio)
+
 class AudioManager:
-    def __init__(self, ui_manager: UIManager):
-        """Initialize audio recording and processing components."""
+    def __init__(self, ui_manager: UIManager, capture: bool = True,
+                 stt: Optional[STTBackend] = None, tts_engine: Optional[TTSEngine] = None,
+                 streaming: bool = STREAMING_STT):
+        """Initialize audio recording and processing components.
+
+        With capture=False no microphone is opened; audio is fed through
+        handle_audio_chunk instead (benchmarks, remote clients). stt and
+        tts_engine let several managers share one loaded model. streaming
+        turns transcription during recording on or off.
+        """
         self.ui_manager = ui_manager
+        self.streaming = streaming
         self.recording = False
-        self.audio_frames: List[bytes] = []
+        self.audio_buffer = AudioBuffer(RECORDING_BUFFER_SECONDS, SAMPLE_RATE)
+        self.streamer: Optional[StreamingTranscriber] = None
+        self.recording_lock = threading.Lock()
         
-        # CUSTOMIZE: Whisper model size - options: tiny, base, small, medium, large
-        # Larger models are more accurate but use more memory and CPU
-        print("[AUDIO] Loading Whisper model...")
-        self.whisper_model = whisper.load_model("medium", device="cpu")
-        print("[AUDIO] Whisper model loaded.")
+        # Voice activity detection for silence trimming and automatic endpointing
+        self.endpointer: Optional[Endpointer] = Endpointer() if VAD_ENABLED else None
+        self.endpoint_fired = False
+        # Called (on its own thread) when trailing silence ends a recording
+        self.on_endpoint: Optional[Callable[[], None]] = None
+        
+        # Barge-in: the microphone is watched while the assistant speaks
+        self.barge_in: Optional[BargeInDetector] = BargeInDetector() if BARGE_IN_ENABLED else None
+        # Called (on its own thread) with the time the user started talking over the assistant
+        self.on_barge_in: Optional[Callable[[float], None]] = None
+        self.preroll: Deque[np.ndarray] = deque(maxlen=max(1, BARGE_IN_PREROLL_MS // FRAME_DURATION_MS))
+        
+        # CUSTOMIZE: Speech-to-text backend, model size and precision are set in config.py
+        # The model loads in the background so audio capture can start right away
+        if stt is None:
+            print("[AUDIO] Loading speech-to-text model in the background...")
+            stt = BackgroundLoadedBackend()
+        self.stt = stt
+        
+        # CUSTOMIZE: Text-to-speech backend and audio cache are set in config.py
+        self.tts_engine = tts_engine or TTSEngine()
         
         # Audio settings from config
         self.chunk_size = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
-        self.audio = pyaudio.PyAudio()
-        
-        # Start recording stream
-        self.stream = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=CHANNELS,
-            rate=SAMPLE_RATE,
-            input=True,
-            frames_per_buffer=self.chunk_size
-        )
+        self.audio: Optional[pyaudio.PyAudio] = None
+        self.capture: Optional[AudioCapture] = None
+        if capture:
+            self.audio = pyaudio.PyAudio()
+            
+            # Start callback-driven capture; chunks arrive on a background thread
+            self.capture = AudioCapture(
+                self.audio, SAMPLE_RATE, CHANNELS, self.chunk_size, CAPTURE_RING_SECONDS
+            )
+            self.capture.start(self.handle_audio_chunk)
     
-    def start_recording(self) -> None:
-        """Start audio recording."""
-        if not self.recording:
+    def start_recording(self, preroll: Optional[List[np.ndarray]] = None) -> None:
+        """Start audio recording, optionally beginning with chunks captured just before."""
+        with self.recording_lock:
+            if self.recording:
+                return
+            # Clear before flagging so the capture thread never appends to stale audio
+            self.audio_buffer.clear()
+            if self.endpointer:
+                self.endpointer.reset()
+            self.endpoint_fired = False
             self.recording = True
-            self.audio_frames = []
+            self.recording_started = time.perf_counter()
+            for samples in preroll or ():
+                self.handle_audio_chunk(samples)
+            if self.streaming:
+                self.streamer = StreamingTranscriber(
+                    self.stt, self.get_recorded_audio, self.get_speech_bounds
+                )
+                self.streamer.start()
             print("[AUDIO] Recording started...")
             
-    def stop_recording(self) -> None:
-        """Stop audio recording."""
-        if self.recording:
+    def stop_recording(self) -> Optional[Recording]:
+        """Stop audio recording and return it, or None if no recording was active."""
+        with self.recording_lock:
+            if not self.recording:
+                return None
             self.recording = False
-            print(f"[AUDIO] Recording stopped. Captured {len(self.audio_frames)} frames")
+            # Copy the speech out now: the next start_recording() clears the buffer and endpointer
+            bounds = self.get_speech_bounds()
+            recording = Recording(
+                self.get_recorded_audio(*bounds) if bounds else None,
+                bounds[0] if bounds else 0,
+                self.streamer
+            )
+            self.streamer = None
+            if recording.streamer is not None:
+                recording.streamer.detach(recording.get_audio, recording.speech_bounds)
+            print(f"[AUDIO] Recording stopped. Captured {self.audio_buffer.duration:.2f}s of audio")
+            tracer.record("capture", time.perf_counter() - self.recording_started,
+                          audio_seconds=round(self.audio_buffer.duration, 2))
+            if self.capture:
+                stats = self.capture.get_stats()
+                tracer.gauge("input_overflows", stats["input_overflows"])
+                tracer.gauge("dropped_samples", stats["dropped_samples"])
+                tracer.gauge("capture_buffered_samples", stats["buffered_samples"])
+                if stats["input_overflows"] or stats["dropped_samples"]:
+                    print(f"[AUDIO] Capture overruns: {stats['input_overflows']} input overflows, "
+                          f"{stats['dropped_samples']} samples dropped")
+            return recording
             
-    def record_audio_frame(self) -> None:
-        """Record a single audio frame if recording is active."""
-        if self.recording:
-            try:
-                data = self.stream.read(self.chunk_size, exception_on_overflow=False)
-                self.audio_frames.append(data)
-            except Exception as e:
-                print(f"[AUDIO] Error recording frame: {e}")
+    def handle_audio_chunk(self, samples: np.ndarray) -> None:
+        """Store a captured chunk if recording is active (runs on the capture thread)."""
+        if not self.recording:
+            if self.barge_in is not None and self.on_barge_in is not None:
+                self._watch_for_barge_in(samples)
+            return
+        self.audio_buffer.append(samples)
+        
+        if self.endpointer and self.endpointer.process(samples):
+            if VAD_AUTO_STOP and self.on_endpoint and not self.endpoint_fired:
+                self.endpoint_fired = True
+                print("[VAD] Trailing silence detected, ending recording.")
+                threading.Thread(target=self.on_endpoint, daemon=True).start()
     
-    def save_recording(self) -> Optional[str]:
-        """Save recorded audio to a temporary WAV file."""
-        if not self.audio_frames:
-            return None
-            
+    def _watch_for_barge_in(self, samples: np.ndarray) -> None:
+        """Start a new recording if the user talks over the assistant's speech."""
+        output = getattr(self.ui_manager, "audio_output", None)
+        if output is None or not self.ui_manager.is_speaking:
+            self.barge_in.reset()
+            self.preroll.clear()
+            return
+        self.preroll.append(samples)
+        
+        # Playback during this chunk plus the time it takes to reach the microphone
+        seconds = len(samples) / SAMPLE_RATE + BARGE_IN_ECHO_TAIL_MS / 1000
+        reference = output.recent(int(seconds * output.sample_rate))
+        if not self.barge_in.process(samples, reference, output.sample_rate):
+            return
+        
+        onset = time.perf_counter() - self.barge_in.speech_seconds
+        self.barge_in.reset()
+        print("[BARGE-IN] User started talking, interrupting the response.")
+        # Record on this thread right away so none of the user's words are lost
+        self.start_recording(list(self.preroll))
+        self.preroll.clear()
+        threading.Thread(target=self.on_barge_in, args=(onset,), daemon=True).start()
+    
+    def get_recorded_audio(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Return captured samples in [start, end) as float32 in [-1, 1]."""
+        return self.audio_buffer.to_float32(start, end)
+    
+    def get_speech_bounds(self) -> Optional[Tuple[int, int]]:
+        """Return (start, end) sample indices of detected speech, or None if there is none yet."""
+        total = len(self.audio_buffer)
+        if not self.endpointer:
+            return (0, total) if total else None
+        return self.endpointer.speech_bounds(total)
+    
+    def save_recording(self, samples: np.ndarray) -> str:
+        """Save float32 samples to a temporary WAV file (debug dump)."""
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
         wf = wave.open(temp_file.name, 'wb')
         wf.setnchannels(CHANNELS)
-        wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
+        wf.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
         wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(b''.join(self.audio_frames))
+        wf.writeframes(np.clip(samples * 32768, -32768, 32767).astype(np.int16).tobytes())
         wf.close()
         return temp_file.name
     
-    def transcribe_audio(self, audio_file: str) -> Tuple[str, str]:
-        """Transcribe audio file to text using Whisper."""
+    def transcribe_audio(self, audio: Union[str, np.ndarray]) -> Tuple[str, str]:
+        """Transcribe an audio file or float32 sample array to text."""
         try:
-            result = self.whisper_model.transcribe(audio_file)
+            result = self.stt.transcribe(audio)
             transcription = result.get("text", "").strip()
             detected_lang = result.get("language", "en")
             print(f"[AUDIO] Transcribed text: {transcription}")
@@ -90,36 +223,40 @@ class AudioManager:
             print(f"[AUDIO] Transcription error: {e}")
             return "", "en"
     
-    def text_to_speech(self, text: str, lang: str = "en") -> None:
-        """Convert text to speech and play it."""
-        if not text or self.ui_manager.is_speaking:
-            return
-            
+    def transcribe_recording(self, recording: Recording) -> Optional[Tuple[str, str]]:
+        """Transcribe a finished recording, finishing its streaming decode if active."""
+        if recording.streamer is not None:
+            transcription, detected_lang = recording.streamer.finish()
+            if recording.audio is None:
+                print("[AUDIO] No speech detected.")
+                return None
+            print(f"[AUDIO] Transcribed text: {transcription}")
+            return transcription, detected_lang
+        
+        if recording.audio is None:
+            print("[AUDIO] No speech detected.")
+            return None
+        
+        # CUSTOMIZE: Set DEBUG_SAVE_RECORDINGS in config.py to keep a WAV of every recording
+        if DEBUG_SAVE_RECORDINGS:
+            with tracer.span("buffer_save"):
+                print(f"[AUDIO] Saved recording to {self.save_recording(recording.audio)}")
+        
+        # Whisper takes the trimmed float32 samples directly, no temp file or ffmpeg decode
+        return self.transcribe_audio(recording.audio)
+    
+    def synthesize_speech(self, text: str, lang: str = "en") -> Optional[str]:
+        """Synthesize text with the resident TTS engine and return a playable file path."""
+        return self.tts_engine.synthesize_to_file(text, self.get_voice_for_language(lang))
+    
+    def detect_language(self, text: str, default: str = "en") -> str:
+        """Detect the language of text for voice selection."""
         try:
-            # Create temp file for TTS output
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            self.ui_manager.current_tts_file = temp_file.name
-            temp_file.close()
-            
-            # Determine voice based on language
-            voice = self.get_voice_for_language(lang)
-            
-            # Use edge-tts for speech synthesis
-            tts_process = subprocess.Popen(
-                ["edge-tts", "--voice", voice, "--text", text, "--write-media", self.ui_manager.current_tts_file],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                startupinfo=self.ui_manager.startupinfo
-            )
-            tts_process.wait()
-            
-            # Play the generated audio
-            self.ui_manager.is_speaking = True
-            self.ui_manager.play_sound(self.ui_manager.current_tts_file)
-            
+            from langdetect import detect
+            return detect(text)
         except Exception as e:
-            print(f"[TTS] Error: {e}")
-            self.ui_manager.is_speaking = False
+            print(f"[Language Detection] Error: {e}")
+            return default
     
     def get_voice_for_language(self, lang: str) -> str:
         """Get the appropriate voice for a language."""
@@ -138,8 +275,7 @@ class AudioManager:
         
     def cleanup(self) -> None:
         """Clean up resources."""
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
+        if self.capture:
+            self.capture.stop()
         if self.audio:
             self.audio.terminate()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import numpy as np
+import pyaudio
+
+from tracing import tracer
+
+def decode_audio_file(path: str, sample_rate: int) -> np.ndarray:
+    """Decode an audio file (WAV, MP3, ...) to mono float32 PCM at sample_rate."""
+    import soundfile as sf
+
+    data, rate = sf.read(path, dtype="float32", always_2d=True)
+    pcm = data.mean(axis=1)
+    if rate != sample_rate and len(pcm):
+        # Linear resampling is plenty for speech and UI cues
+        count = int(len(pcm) * sample_rate / rate)
+        pcm = np.interp(np.arange(count) * (rate / sample_rate), np.arange(len(pcm)), pcm)
+    return np.ascontiguousarray(pcm, dtype=np.float32)
+
+class PlaybackHandle:
+    def __init__(self, pcm: np.ndarray):
+        """A PCM buffer queued on the output stream."""
+        self.pcm = pcm
+        self.position = 0
+        self.requested_at = time.perf_counter()
+        self.first_sample_latency: Optional[float] = None
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the buffer has finished playing or was stopped."""
+        return self.done.wait(timeout)
+
+class AudioOutput:
+    def __init__(self, sample_rate: int, block_size: int, history_seconds: float = 1.0):
+        """One long-lived output stream that plays queued PCM buffers back to back.
+
+        The PortAudio callback copies samples from the head of the queue and
+        outputs silence when it is empty, so starting a sound costs no process
+        spawn or device open, and stop() takes effect at the next block. The
+        last history_seconds of output are kept so the microphone signal can
+        be compared against what was played (barge-in echo suppression).
+        The latency from a play request to its first sample reaching the
+        device is traced as first_sample, from the thread of the next
+        play() or stop() call rather than from the callback.
+        """
+        self.sample_rate = sample_rate
+        self.queue: Deque[PlaybackHandle] = deque()
+        self.lock = threading.Lock()
+        self.cues: Dict[str, np.ndarray] = {}
+        self.started: Deque[PlaybackHandle] = deque()  # First sample output, latency not traced yet
+        self.history = np.zeros(int(sample_rate * history_seconds), dtype=np.float32)
+        self.history_end = 0  # Total samples output so far
+
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paFloat32,
+            channels=1,
+            rate=sample_rate,
+            output=True,
+            frames_per_buffer=block_size,
+            stream_callback=self._callback
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Fill one output block from the queue, padding with silence."""
+        out = np.zeros(frame_count, dtype=np.float32)
+        filled = 0
+        # Time until this block reaches the speaker
+        device_delay = max(0.0, time_info.get("output_buffer_dac_time", 0.0) - time_info.get("current_time", 0.0))
+
+        with self.lock:
+            while filled < frame_count and self.queue:
+                handle = self.queue[0]
+                if handle.first_sample_latency is None:
+                    handle.first_sample_latency = (
+                        time.perf_counter() - handle.requested_at + device_delay + filled / self.sample_rate
+                    )
+                    self.started.append(handle)
+
+                count = min(frame_count - filled, len(handle.pcm) - handle.position)
+                out[filled:filled + count] = handle.pcm[handle.position:handle.position + count]
+                handle.position += count
+                filled += count
+                if handle.position >= len(handle.pcm):
+                    self.queue.popleft()
+                    handle.done.set()
+
+            start = self.history_end % len(self.history)
+            first = min(frame_count, len(self.history) - start)
+            self.history[start:start + first] = out[:first]
+            self.history[:frame_count - first] = out[first:]
+            self.history_end += frame_count
+
+        return out.tobytes(), pyaudio.paContinue
+
+    def recent(self, count: int) -> np.ndarray:
+        """The last count samples sent to the device, oldest first (silence included)."""
+        count = min(count, len(self.history))
+        with self.lock:
+            end = self.history_end % len(self.history)
+            return np.roll(self.history, -end)[len(self.history) - count:]
+
+    def load_cue(self, path: str) -> None:
+        """Decode a sound once and keep it in memory for instant playback."""
+        self.cues[path] = decode_audio_file(path, self.sample_rate)
+
+    def play_file(self, path: str) -> PlaybackHandle:
+        """Queue an audio file, using the pre-decoded copy if it is a loaded cue."""
+        pcm = self.cues.get(path)
+        if pcm is None:
+            pcm = decode_audio_file(path, self.sample_rate)
+        return self.play(pcm)
+
+    def _trace_latencies(self) -> None:
+        while True:
+            try:
+                handle = self.started.popleft()
+            except IndexError:
+                return
+            tracer.record("first_sample", handle.first_sample_latency)
+
+    def play(self, pcm: np.ndarray) -> PlaybackHandle:
+        """Queue mono float32 PCM at the output sample rate."""
+        self._trace_latencies()
+        handle = PlaybackHandle(pcm)
+        if not len(pcm):
+            handle.done.set()
+            return handle
+        with self.lock:
+            self.queue.append(handle)
+        return handle
+
+    def stop(self) -> None:
+        """Drop everything queued or playing; silence starts with the next output block."""
+        self._trace_latencies()
+        with self.lock:
+            for handle in self.queue:
+                handle.done.set()
+            self.queue.clear()
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.queue)
+
+    def close(self) -> None:
+        """Stop and close the output stream."""
+        self.stop()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
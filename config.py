@@ -1,10 +1,17 @@
-from typing import Tuple
+from typing import Optional, Tuple
 import os
-import requests
+import json
+import time
+import threading
 from datetime import datetime
 
+from startup_timer import startup_timer
+
 # CUSTOMIZE: File settings
-HISTORY_FILE = "conversation_history.json"
+HISTORY_FILE = "conversation_history.json"       # Legacy format, migrated to the log on first start
+HISTORY_LOG_FILE = "conversation_history.jsonl"  # Append-only log, one turn per line
+HISTORY_MAX_TURNS = 50                           # Turns kept in memory and after compaction
+HISTORY_COMPACT_FACTOR = 4                       # Compact once the log holds this many times HISTORY_MAX_TURNS
 
 # CUSTOMIZE: Voice commands to exit the assistant
 EXIT_COMMANDS = ["bye", "quit", "exit"]
@@ -14,16 +21,192 @@ SAMPLE_RATE = 16000  # Audio sample rate in Hz
 CHANNELS = 1         # Mono audio
 FRAME_DURATION_MS = 30  # Frame duration in milliseconds
 
+# CUSTOMIZE: Speech-to-text backend
+# "whisper" (openai-whisper, fp32) or "faster-whisper" (CTranslate2, quantized)
+STT_BACKEND = "whisper"
+STT_MODEL = "medium"        # tiny, base, small, medium, large - larger is more accurate but slower
+STT_DEVICE = "cpu"          # Whisper runs on CPU to leave GPU memory for the Ollama model
+STT_COMPUTE_TYPE = "int8"   # faster-whisper only: int8, int8_float32, float32
+STT_THREADS = 0             # CPU threads for inference, 0 = library default
+# whisper backend on CPU: the weights are converted once to an fp32 file in STT_WEIGHTS_DIR and
+# memory-mapped, so all assistant processes on the machine share one copy in the page cache
+STT_MMAP_WEIGHTS = True
+STT_WEIGHTS_DIR = "~/.cache/whisper"
+
+# CUSTOMIZE: Batched transcription for the server and stt_benchmark.py --concurrent
+# Utterances that arrive within the window are decoded as one batch; a longer window
+# gives bigger batches (more throughput) but delays every utterance by up to that much
+STT_BATCH_WINDOW_MS = 30
+STT_BATCH_MAX = 8
+
+# CUSTOMIZE: Streaming transcription - decode while the user is still talking
+# Only the uncommitted tail is decoded after recording stops
+STREAMING_STT = True
+STREAM_STEP_SECONDS = 1.0        # How often a new window is decoded
+STREAM_MIN_WINDOW_SECONDS = 1.0  # Skip decoding windows shorter than this
+STREAM_MAX_WINDOW_SECONDS = 15.0 # Force commits once a window grows past this
+
+# CUSTOMIZE: Recording buffer - samples are kept in memory and passed straight to Whisper
+RECORDING_BUFFER_SECONDS = 30  # Preallocated capacity, grows automatically if exceeded
+DEBUG_SAVE_RECORDINGS = False  # Also dump each recording to a temp WAV file for debugging
+CAPTURE_RING_SECONDS = 5       # Capture ring size; audio is dropped (and counted) if it overflows
+
+# CUSTOMIZE: Voice activity detection - trims silence and ends recordings automatically
+VAD_ENABLED = True
+VAD_AUTO_STOP = True            # Stop recording after trailing silence instead of a second alt press
+VAD_BACKEND = "energy"          # "energy" or "webrtc" (requires the optional webrtcvad package)
+VAD_ENERGY_THRESHOLD_DB = -45.0 # Minimum frame energy (dBFS) counted as speech
+VAD_NOISE_MARGIN_DB = 10.0      # Speech must also be this far above the measured noise floor
+VAD_MAX_ZCR = 0.35              # Frames with a higher zero-crossing rate are treated as noise
+VAD_WEBRTC_AGGRESSIVENESS = 2   # 0 (least) to 3 (most aggressive), webrtc backend only
+VAD_MIN_SPEECH_MS = 90          # Speech needed before a recording counts as started
+VAD_SILENCE_TIMEOUT_MS = 900    # Trailing silence that ends the recording
+VAD_PADDING_MS = 150            # Audio kept around detected speech when trimming
+
+# CUSTOMIZE: Barge-in - start talking while the assistant speaks to interrupt it
+# The microphone stays live during playback. The assistant's own voice coming back through the
+# microphone is suppressed by comparing against what is being played; headphones make it most reliable
+BARGE_IN_ENABLED = False
+BARGE_IN_MIN_SPEECH_MS = 150    # Speech above the expected echo needed before interrupting
+BARGE_IN_ECHO_MARGIN_DB = 6.0   # How far the microphone must be above the expected echo level
+BARGE_IN_ECHO_TAIL_MS = 250     # Speaker-to-microphone delay covered when estimating the echo
+BARGE_IN_PREROLL_MS = 300       # Audio from before the detection kept at the start of the new recording
+
+# CUSTOMIZE: Streaming speech - responses are spoken sentence by sentence while the LLM is still generating
+TTS_MIN_SEGMENT_CHARS = 20    # Shorter sentences are merged with the next one
+TTS_CLAUSE_SPLIT_CHARS = 80   # Long sentences are split at a comma/semicolon once this long
+
+# CUSTOMIZE: Turn pipeline - bounded queues between stages; a full queue pauses the stage feeding it
+PIPELINE_QUERY_QUEUE = 1        # Transcribed queries waiting for the LLM
+PIPELINE_SEGMENT_QUEUE = 4      # Sentences waiting for synthesis
+PIPELINE_AUDIO_QUEUE = 2        # Synthesized segments waiting for playback
+PIPELINE_PLAYBACK_AHEAD = 2     # Segments queued on the output stream at once
+
+# CUSTOMIZE: Text-to-speech engine
+TTS_BACKEND = "edge"          # "edge" (online Edge voices) or "offline" (local pyttsx3 voice, no network)
+OFFLINE_TTS_RATE = 180        # Words per minute for the offline voice
+TTS_CACHE_ENABLED = True      # Reuse synthesized audio for repeated phrases
+TTS_CACHE_DIR = "tts_cache"
+TTS_CACHE_MAX_MB = 50         # Least recently used audio is evicted beyond this size
+
+# CUSTOMIZE: Audio output - one stream plays all speech and UI sounds
+OUTPUT_SAMPLE_RATE = 24000    # Edge voices are 24 kHz; other sounds are resampled
+OUTPUT_BLOCK_SIZE = 256       # Frames per output block; smaller stops and starts faster
+UI_SOUNDS = ["confirmation.mp3", "close.wav"]  # Decoded into memory at startup
+
 # CUSTOMIZE: LLM model settings - change to your preferred Ollama model
 LLM_MODEL = "llama3.1"
 
+# CUSTOMIZE: Model residency - keep the Ollama models loaded between questions
+OLLAMA_KEEP_ALIVE = "30m"    # How long Ollama keeps a model loaded after a request (-1 = until Ollama stops)
+OLLAMA_REWARM_SECONDS = 600  # Send a warm-up request after this long without an Ollama call (0 = off)
+
+# CUSTOMIZE: Conversation context - history fills a token budget instead of a fixed number of turns
+# Older turns are folded into a rolling summary so the start of the prompt rarely changes and
+# Ollama can reuse its prompt cache. Keep the budget below the model's context window.
+CONTEXT_TOKEN_BUDGET = 1500  # Approximate tokens for system prompt, summary, history and query
+CONTEXT_FOLD_FRACTION = 0.5  # History space left in use after folding old turns
+CONTEXT_EXTRA_TOKENS = 1000   # Per-query context (memories, search data) on top of the budget; trimmed, never folds history
+SUMMARY_NUM_PREDICT = 160    # Maximum length of the rolling summary
+
+# CUSTOMIZE: Long-term memory - every turn is embedded so related past turns can be recalled
+# Needs an Ollama embedding model: ollama pull nomic-embed-text
+MEMORY_ENABLED = True
+EMBED_MODEL = "nomic-embed-text"
+MEMORY_DIR = "memory_index"
+MEMORY_TOP_K = 3                # Past turns added to the prompt at most
+MEMORY_MIN_SIMILARITY = 0.55    # Cosine similarity a past turn needs to be recalled
+MEMORY_RECALL_TIMEOUT = 2.0     # Seconds to wait for the query embedding before answering without recall
+
+# CUSTOMIZE: Answer cache - repeated offline questions are answered without calling the LLM
+# Answers that needed an internet search are never cached
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_CACHE_SIMILARITY = 0.92  # Cosine similarity for two questions to count as the same
+ANSWER_CACHE_LOOKUP_TIMEOUT = 2.0  # Seconds to wait for the query embedding before matching exact text only
+# Questions containing these words depend on the time or on earlier turns and are never cached
+ANSWER_CACHE_EXCLUDE_WORDS = {
+    "today", "tonight", "tomorrow", "yesterday", "now", "time", "date", "day", "current", "currently",
+    "latest", "recent", "news", "weather", "it", "this", "that", "these", "those", "he", "she", "they",
+    "them", "again", "previous", "last", "earlier", "before", "my", "i",
+}
+# Follow-ups ("tell me more", "and the second one?") only make sense after the previous turn and are
+# never cached: questions need this many words besides filler words and must not start with a continuation
+ANSWER_CACHE_MIN_WORDS = 2
+ANSWER_CACHE_FOLLOW_UP_STARTS = {"and", "but", "also", "or", "so", "then", "what about", "how about", "go on"}
+
+# CUSTOMIZE: Service endpoints and HTTP limits
+OLLAMA_HOST = "http://localhost:11434"
+SEARXNG_URL = "http://localhost:8080/search"
+# Timeouts are in seconds; retries cover failed connections and 5xx responses, not read timeouts
+HTTP_ENDPOINTS = {
+    "searxng": {"connect_timeout": 2.0, "read_timeout": 6.0, "retries": 2, "max_concurrency": 4},
+    "web": {"connect_timeout": 2.0, "read_timeout": 3.0, "retries": 0, "max_concurrency": 8},
+    "ollama": {"connect_timeout": 2.0, "read_timeout": 120.0, "retries": 1, "max_concurrency": 2},
+}
+WEB_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# CUSTOMIZE: Internet retrieval
+# "pages" fetches the top results concurrently; "onlineagent" hands only the first URL to llm_axe
+SEARCH_PAGE_METHOD = "pages"
+SEARCH_TOP_N = 4                   # Result pages fetched per search
+PAGE_FETCH_DEADLINE_SECONDS = 3.0  # Pages that are not ready by then are skipped
+PAGE_MAX_CHARS = 50000             # Extracted text kept per page
+SEARCH_CACHE_TTL_SECONDS = 120     # Repeated searches within this window reuse the results
+SEARCH_CACHE_MAX_ENTRIES = 64
+PAGE_CACHE_TTL_SECONDS = 600
+PAGE_CACHE_MAX_CHARS = 2000000     # Total extracted page text kept in memory
+
+# CUSTOMIZE: Internet context - pages are split into passages and only the best BM25 matches are sent
+INTERNET_CONTEXT_TOKENS = 800      # Approximate token budget for search data in the prompt
+PASSAGE_WORDS = 60                 # Words per passage
+PASSAGE_OVERLAP_WORDS = 15         # Words shared by neighbouring passages
+PASSAGE_MIN_LINE_WORDS = 6         # Shorter lines (menus, buttons, link lists) are dropped as boilerplate
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# CUSTOMIZE: Start the offline answer while the planner decides whether to search the internet
+# The offline answer is discarded if a search is needed. Works best with OLLAMA_NUM_PARALLEL >= 2
+# so the planner and the answer are generated at the same time. Only used by the "json" and "agent"
+# planners: the "tools" planner decides and answers in one generation, so there is nothing to overlap
+SPECULATIVE_OFFLINE_ANSWER = True
+
+# CUSTOMIZE: How the assistant decides whether to search the internet
+# "tools" - one generation that either answers or calls a web_search tool (needs a tool-capable model)
+# "json"  - a short planning call constrained to a JSON schema
+# "agent" - the original llm_axe planning agent with a free-text prompt
+PLANNER_MODE = "tools"
+PLANNER_NUM_PREDICT = 48  # Token limit for the "json" planner
+
+# CUSTOMIZE: Latency tracing - one timed span per stage of every turn
+# Summarize with: python tracing.py
+TRACE_ENABLED = True
+TRACE_FILE = "traces/trace.jsonl"  # Rotated when it reaches TRACE_MAX_MB
+TRACE_MAX_MB = 5
+TRACE_BACKUPS = 3
+METRICS_PORT = 0                   # Serve Prometheus metrics on this localhost port (0 = off)
+
+# CUSTOMIZE: Headless server (python server.py) - clients stream audio over WebSocket
+# Sessions share one speech-to-text model, one TTS engine and the Ollama client
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_SESSIONS = 0  # 0 = one session per SERVER_CPUS_PER_SESSION cores
+SERVER_CPUS_PER_SESSION = 2
+SERVER_SESSIONS_DIR = "sessions"  # Per-session history and memory
+
 # CUSTOMIZE: Default location if auto-detection fails
 DEFAULT_CITY = "Your City"
 DEFAULT_COUNTRY = "Your Country"
 
+# CUSTOMIZE: Location cache - the IP lookup result is reused for this long
+LOCATION_CACHE_FILE = "location_cache.json"
+LOCATION_CACHE_TTL_HOURS = 24
+
 def detect_location() -> Tuple[str, str]:
     """Auto-detect user location from IP address with fallback to defaults."""
     try:
+        import requests
         response = requests.get('https://ipapi.co/json/', timeout=3)
         if response.status_code == 200:
             data = response.json()
@@ -35,17 +218,57 @@ def detect_location() -> Tuple[str, str]:
     
     return DEFAULT_CITY, DEFAULT_COUNTRY
 
+def load_cached_location() -> Optional[Tuple[str, str, bool]]:
+    """Return (city, country, is_fresh) from the location cache, or None if there is none."""
+    try:
+        with open(LOCATION_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        age = time.time() - data["timestamp"]
+        return data["city"], data["country"], age < LOCATION_CACHE_TTL_HOURS * 3600
+    except Exception:
+        return None
+
+def save_cached_location(city: str, country: str) -> None:
+    """Write the detected location to the cache file."""
+    try:
+        with open(LOCATION_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"city": city, "country": country, "timestamp": time.time()}, f)
+    except Exception as e:
+        print(f"[LOCATION] Error saving cache: {e}")
+
+def refresh_location() -> None:
+    """Detect the location and update the cache and module-level values."""
+    global CITY, COUNTRY
+    with startup_timer.background("location lookup"):
+        city, country = detect_location()
+        if (city, country) != (DEFAULT_CITY, DEFAULT_COUNTRY):
+            save_cached_location(city, country)
+            CITY, COUNTRY = city, country
+
+def get_location() -> Tuple[str, str]:
+    """Return the current best-known (city, country)."""
+    return CITY, COUNTRY
+
 # Get location and date information
-CITY, COUNTRY = detect_location()
+# A cached location is used immediately; a stale or missing cache is refreshed in the background
+_cached = load_cached_location()
+CITY, COUNTRY = (_cached[0], _cached[1]) if _cached else (DEFAULT_CITY, DEFAULT_COUNTRY)
+if not _cached or not _cached[2]:
+    threading.Thread(target=refresh_location, daemon=True).start()
 DATE_STR = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 # CUSTOMIZE: System prompt that controls the assistant's behavior and responses
-CONVERSATION_CONTEXT = (
-    f"You are a helpful voice assistant. "
-    f"The user's location is {CITY}, {COUNTRY}, and the current time is {DATE_STR}. "
-    f"Keep your answers concise, clear and helpful. "
-    f"Only mention location and time information when directly relevant to the user's question. "
-    f"Do not make up information about current events, weather, or news unless you have access to it via internet search. "
-    f"Respond directly to questions without unnecessary acknowledgments or apologies. "
-    f"When unsure about something, clearly state that you don't know rather than speculating."
-)
\ No newline at end of file
+def build_conversation_context() -> str:
+    """Build the system prompt from the current location and startup time."""
+    city, country = get_location()
+    return (
+        f"You are a helpful voice assistant. "
+        f"The user's location is {city}, {country}, and the current time is {DATE_STR}. "
+        f"Keep your answers concise, clear and helpful. "
+        f"Only mention location and time information when directly relevant to the user's question. "
+        f"Do not make up information about current events, weather, or news unless you have access to it via internet search. "
+        f"Respond directly to questions without unnecessary acknowledgments or apologies. "
+        f"When unsure about something, clearly state that you don't know rather than speculating."
+    )
+
+CONVERSATION_CONTEXT = build_conversation_context()
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from typing import Dict, List, Optional
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_FOLD_FRACTION, CONTEXT_EXTRA_TOKENS, SUMMARY_NUM_PREDICT
+from http_client import get_transport
+from passage_ranker import estimate_tokens
+
+# CUSTOMIZE: Instructions for folding older turns into the rolling summary
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and a voice assistant. "
+    "Keep facts about the user, their preferences and open topics; drop small talk. "
+    "Answer with the new summary only, in at most five short sentences."
+)
+
+class ContextBuilder:
+    def __init__(self, conversation_manager, model: str):
+        """Builds chat messages that fit CONTEXT_TOKEN_BUDGET and keep a stable prefix.
+
+        Messages are laid out as system prompt + rolling summary, then every
+        turn since the summary anchor, then per-query context (recalled
+        memories, search data) and the query.
+        Because the window grows from a fixed anchor instead of sliding by one
+        turn each time, the prompt prefix is unchanged between turns and
+        Ollama can reuse its KV cache. When the turns no longer fit, the
+        oldest are dropped until they use CONTEXT_FOLD_FRACTION of the space,
+        and folded into the summary in the background. Per-query context has
+        its own CONTEXT_EXTRA_TOKENS budget and is trimmed to fit, so a search
+        turn never folds history or moves the anchor.
+        """
+        self.conversation_manager = conversation_manager
+        self.model = model
+        self.anchor = 0  # Index of the first turn sent verbatim
+        self.summary = ""
+        self.lock = threading.Lock()
+        self.pending: List[Dict[str, str]] = []  # Dropped turns not yet in the summary
+        self.summarizing = False
+
+    @staticmethod
+    def _turn_tokens(user: str, assistant: str) -> int:
+        return estimate_tokens(user) + estimate_tokens(assistant) + 8  # Role and template overhead
+
+    @staticmethod
+    def _trim(text: str, token_budget: int) -> str:
+        """Cut text to about token_budget tokens, at a line break where possible."""
+        if estimate_tokens(text) <= token_budget:
+            return text
+        cut = text[:token_budget * 4]
+        return cut[:cut.rfind("\n")] if "\n" in cut else cut
+
+    def build(self, system_prompt: str, query: str, extra_context: Optional[str] = None) -> List[Dict[str, str]]:
+        """Return chat messages for query; extra_context (e.g. search data) goes after the history."""
+        # Older turns related to the query, recalled from long-term memory
+        _, recent_users, _ = self.conversation_manager.get_turns(self.anchor)
+        related = self.conversation_manager.recall(query, exclude=recent_users)
+        if related:
+            memories = "\n".join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in related)
+            memories = f"Possibly relevant earlier conversation:\n{memories}"
+            extra_context = f"{memories}\n\n{extra_context}" if extra_context else memories
+
+        with self.lock:
+            start, users, assistants = self.conversation_manager.get_turns(self.anchor)
+            self.anchor = start
+            prefix = system_prompt
+            if self.summary:
+                prefix += f"\n\nSummary of the earlier conversation: {self.summary}"
+
+            available = CONTEXT_TOKEN_BUDGET - estimate_tokens(prefix) - estimate_tokens(query)
+            costs = [self._turn_tokens(u, a) for u, a in zip(users, assistants)]
+
+            if sum(costs) > available:
+                # Fold turns from the front, leaving room so later turns append without moving the anchor
+                target = max(0, int(available * CONTEXT_FOLD_FRACTION))
+                dropped = 0
+                while dropped < len(costs) and sum(costs[dropped:]) > target:
+                    self.pending.append({"user": users[dropped], "assistant": assistants[dropped]})
+                    dropped += 1
+                users, assistants = users[dropped:], assistants[dropped:]
+                self.anchor += dropped
+                print(f"[CONTEXT] Folding {dropped} older turns into the summary")
+                self._start_summary()
+
+        messages = [{"role": "system", "content": prefix}]
+        for user, assistant in zip(users, assistants):
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        if extra_context:
+            messages.append({"role": "system", "content": self._trim(extra_context, CONTEXT_EXTRA_TOKENS)})
+        messages.append({"role": "user", "content": query})
+        return messages
+
+    def _start_summary(self) -> None:
+        """Summarize pending turns on a background thread (caller holds the lock)."""
+        if self.summarizing or not self.pending:
+            return
+        self.summarizing = True
+        threading.Thread(target=self._summarize, daemon=True).start()
+
+    def _summarize(self) -> None:
+        with self.lock:
+            turns, self.pending = self.pending, []
+            summary = self.summary
+
+        transcript = "\n".join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in turns)
+        try:
+            response = asyncio.run(get_transport().ollama_chat(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Current summary: {summary or '(none)'}\n\nNew turns:\n{transcript}"},
+                ],
+                options={"num_predict": SUMMARY_NUM_PREDICT, "temperature": 0}
+            ))
+            summary = response["message"]["content"].strip()
+        except Exception as e:
+            print(f"[CONTEXT] Summary update failed: {e}")
+
+        with self.lock:
+            self.summary = summary
+            self.summarizing = False
+            # Turns dropped while this summary was being written
+            self._start_summary()
@@ -1,69 +1,213 @@
 import os
 import json
-from typing import Dict, List, Any
+import queue
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Any, Optional, Tuple
 
-from config import HISTORY_FILE
+from config import HISTORY_FILE, HISTORY_LOG_FILE, HISTORY_MAX_TURNS, HISTORY_COMPACT_FACTOR, MEMORY_ENABLED
+from memory_index import MemoryIndex
 
 class ConversationManager:
-    def __init__(self):
-        """Initialize conversation history manager."""
-        self.history_file = HISTORY_FILE
+    def __init__(self, log_file: str = HISTORY_LOG_FILE, legacy_file: Optional[str] = HISTORY_FILE,
+                 memory_dir: Optional[str] = None):
+        """Conversation history kept in memory and persisted to an append-only log.
+
+        Each turn is one JSON line appended to HISTORY_LOG_FILE by a
+        write-behind thread, so update_conversation never blocks on disk.
+        A crash can at worst leave a partial last line, which is skipped on
+        load. When the log grows to HISTORY_COMPACT_FACTOR times the kept
+        window it is rewritten to a temporary file and atomically replaced.
+        Server sessions pass their own log_file and memory_dir.
+        """
+        self.history_file = legacy_file  # Legacy JSON file, migrated on first load
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.log_lines = 0
+        self.first_turn = 0  # Number of the oldest turn in memory, counted from startup
         self.history = self.load_conversation_history()
-    
-    def reset_conversation_history(self) -> Dict[str, List[str]]:
-        """Reset conversation history file and return empty history."""
-        default_data = {"user": [], "assistant": []}
-        with open(self.history_file, "w", encoding="utf-8") as f:
-            json.dump(default_data, f, indent=4)
-        return default_data
-
-    def load_conversation_history(self) -> Dict[str, List[str]]:
-        """Load conversation history from file or create new if not exists."""
-        if os.path.exists(self.history_file):
+
+        self.writes: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+        # Semantic index over every turn, including those that have left the window
+        self.memory = None
+        if MEMORY_ENABLED:
+            self.memory = MemoryIndex(memory_dir) if memory_dir else MemoryIndex()
+        if self.memory is not None and not len(self.memory):
+            for user, assistant in zip(self.history["user"], self.history["assistant"]):
+                self.memory.add(user, assistant)
+
+    def _new_history(self) -> Dict[str, Deque[str]]:
+        return {"user": deque(maxlen=HISTORY_MAX_TURNS), "assistant": deque(maxlen=HISTORY_MAX_TURNS)}
+
+    def reset_conversation_history(self) -> Dict[str, Deque[str]]:
+        """Reset the conversation log and return empty history."""
+        self._rewrite_log([])
+        return self._new_history()
+
+    def load_conversation_history(self) -> Dict[str, Deque[str]]:
+        """Load conversation history from the log, migrating the legacy JSON file if needed."""
+        if not os.path.exists(self.log_file) and self.history_file and os.path.exists(self.history_file):
+            return self._migrate_json_history()
+
+        history = self._new_history()
+        if not os.path.exists(self.log_file):
+            return self.reset_conversation_history()
+        damaged = False
+        try:
+            with open(self.log_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.log_lines += 1
+                    try:
+                        turn = json.loads(line)
+                        history["user"].append(turn["user"])
+                        history["assistant"].append(turn["assistant"])
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        # Partial line from an interrupted write
+                        damaged = True
+                    damaged = damaged or not line.endswith("\n")
+        except Exception as e:
+            print(f"[HISTORY] Error loading history: {e}")
+            return history
+
+        if damaged:
+            # Rewrite so new turns are not appended onto a partial line
+            print("[HISTORY] Skipped an incomplete history entry; repairing the log.")
+            self._rewrite_log(self._turns(history))
+        return history
+
+    def _migrate_json_history(self) -> Dict[str, Deque[str]]:
+        """Convert the old JSON history file into the log format."""
+        history = self._new_history()
+        try:
+            with open(self.history_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("Invalid JSON format in history file.")
+            for user, assistant in zip(data.get("user", []), data.get("assistant", [])):
+                history["user"].append(user)
+                history["assistant"].append(assistant)
+        except (json.JSONDecodeError, ValueError):
+            print("[HISTORY] Corrupted legacy history file. Starting fresh.")
+        except Exception as e:
+            print(f"[HISTORY] Error reading legacy history: {e}")
+
+        self._rewrite_log(self._turns(history))
+        os.replace(self.history_file, self.history_file + ".migrated")
+        print(f"[HISTORY] Migrated {len(history['user'])} turns to {self.log_file}")
+        return history
+
+    @staticmethod
+    def _turns(history: Dict[str, Deque[str]]) -> List[Dict[str, Any]]:
+        return [{"user": u, "assistant": a} for u, a in zip(history["user"], history["assistant"])]
+
+    def _rewrite_log(self, turns: List[Dict[str, Any]]) -> None:
+        """Atomically replace the log with the given turns."""
+        temp_path = self.log_file + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for turn in turns:
+                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.log_file)
+        self.log_lines = len(turns)
+
+    def _write_loop(self) -> None:
+        """Append queued turns to the log and compact it when it gets too long."""
+        while True:
+            turn = self.writes.get()
             try:
-                with open(self.history_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    if not isinstance(data, dict):
-                        raise ValueError("Invalid JSON format in history file.")
-                    for key in ["user", "assistant"]:
-                        if key not in data:
-                            data[key] = []
-                    return data
-            except (json.JSONDecodeError, ValueError):
-                print("[HISTORY] Corrupted file. Resetting history.")
-                return self.reset_conversation_history()
+                if turn is None:
+                    return
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+                    # Write any other turns that queued up meanwhile in the same batch
+                    while True:
+                        try:
+                            turn = self.writes.get_nowait()
+                        except queue.Empty:
+                            break
+                        if turn is None:
+                            self.writes.put(None)
+                            self.writes.task_done()
+                            break
+                        f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+                        self.log_lines += 1
+                        self.writes.task_done()
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.log_lines += 1
+
+                if self.log_lines > HISTORY_MAX_TURNS * HISTORY_COMPACT_FACTOR:
+                    with self.lock:
+                        # With nothing queued, the in-memory window matches the log
+                        if self.writes.empty():
+                            self._rewrite_log(self._turns(self.history))
             except Exception as e:
-                print(f"[HISTORY] Error loading history: {e}")
-                return self.reset_conversation_history()
-        return self.reset_conversation_history()
+                print(f"[HISTORY] Error saving history: {e}")
+            finally:
+                self.writes.task_done()
 
     def save_conversation_history(self) -> None:
-        """Save current conversation history to file."""
-        try:
-            with open(self.history_file, "w", encoding="utf-8") as f:
-                json.dump(self.history, f, indent=4)
-        except Exception as e:
-            print(f"[HISTORY] Error saving history: {e}")
+        """Block until every queued turn has been written to disk."""
+        self.writes.join()
+
+    def close(self) -> None:
+        """Flush pending turns and stop the writer and memory indexer threads."""
+        self.writes.put(None)
+        self.writer.join(timeout=5)
+        if self.memory is not None:
+            self.memory.close()
 
     def update_conversation(self, user_input: str, assistant_response: str) -> None:
-        """Add new conversation turn and maintain history size."""
-        self.history["user"].append(user_input)
-        self.history["assistant"].append(assistant_response)
-        
-        # CUSTOMIZE: Maximum number of conversation turns to store
-        # Reduce this number if you want to limit memory usage
-        max_history_size = 50
-        
-        if len(self.history["user"]) > max_history_size:
-            self.history["user"].pop(0)
-            self.history["assistant"].pop(0)
-        self.save_conversation_history()
-        
-    def get_recent_history(self, max_turns: int = 15) -> Dict[str, List[str]]:
-        """Get the most recent conversation history for context."""
+        """Add new conversation turn; it is persisted in the background."""
+        with self.lock:
+            # The deques drop the oldest turn once HISTORY_MAX_TURNS is reached
+            if len(self.history["user"]) == HISTORY_MAX_TURNS:
+                self.first_turn += 1
+            self.history["user"].append(user_input)
+            self.history["assistant"].append(assistant_response)
+            self.writes.put({"user": user_input, "assistant": assistant_response, "time": time.time()})
+        if self.memory is not None:
+            self.memory.add(user_input, assistant_response)
+
+    def get_recent_history(self, max_turns: int = 15, query: Optional[str] = None) -> Dict[str, Any]:
+        """Get the most recent conversation history for context.
+
+        With a query, "related" also lists earlier turns relevant to it that
+        fall outside the recent window.
+        """
         # CUSTOMIZE: Number of recent turns to include in LLM context
         # Lower values save tokens, higher values give more conversation context
-        return {
-            "user": self.history["user"][-max_turns:],
-            "assistant": self.history["assistant"][-max_turns:]
-        }
\ No newline at end of file
+        with self.lock:
+            history: Dict[str, Any] = {
+                "user": list(self.history["user"])[-max_turns:],
+                "assistant": list(self.history["assistant"])[-max_turns:]
+            }
+        if query:
+            history["related"] = self.recall(query, exclude=history["user"])
+        return history
+
+    def recall(self, query: str, exclude: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """Return remembered turns most relevant to the query, skipping those whose user text is in exclude."""
+        if self.memory is None:
+            return []
+        return self.memory.search(query, exclude=exclude)
+
+    def get_turns(self, start: int = 0) -> Tuple[int, List[str], List[str]]:
+        """Return (number of the first returned turn, user, assistant) for turns numbered start onward.
+
+        Turns are numbered from the oldest one loaded at startup; turns that
+        have already left memory are skipped.
+        """
+        with self.lock:
+            start = max(start, self.first_turn)
+            offset = start - self.first_turn
+            return (
+                start,
+                list(self.history["user"])[offset:],
+                list(self.history["assistant"])[offset:]
+            )
@@ -0,0 +1,364 @@
+"""Offline end-to-end benchmark.
+
+Usage:
+    python e2e_benchmark.py utterance1.wav utterance2.wav [--baseline benchmarks/baseline.json]
+    python e2e_benchmark.py benchmarks/corpus/*.wav --update-baseline
+
+Replays WAV utterances through the real AudioManager, LLMInterface and turn
+pipeline without a microphone, keyboard or network. Ollama and SearXNG are
+replaced by local HTTP servers with configurable latencies, and speech
+synthesis by a stub TTS backend. Reports time to first audio, STT
+real-time factor, LLM round trips per turn and peak RSS, and exits with
+status 1 if a metric regressed against the stored baseline.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import config
+from stt_benchmark import load_wav, peak_rss_mb
+
+STUB_ANSWER = (
+    "Here is a short answer from the benchmark model. It has a few sentences so speech can start early. "
+    "The last sentence closes the turn."
+)
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latencies: Dict[str, float]):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latencies = latencies
+        self.requests: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, status: int = 200) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text: str, content_type: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+class OllamaHandler(StubHandler):
+    """Mimics /api/chat (streamed or not, with tool calls and JSON format), /api/generate and /api/embed."""
+
+    def do_POST(self):
+        request = self._read_json()
+        self.server.count(self.path)
+        latencies = self.server.latencies
+        time.sleep(latencies["llm_first_token_ms"] / 1000)
+
+        if self.path == "/api/embed":
+            texts = request.get("input") or [""]
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send_json({"model": request.get("model"), "embeddings": [self._embed(t) for t in texts]})
+        elif self.path == "/api/generate":
+            self._send_json({"model": request.get("model"), "response": "", "done": True})
+        elif self.path == "/api/chat":
+            message = self._answer(request)
+            if request.get("stream", True):
+                self._stream_message(request.get("model"), message, latencies["llm_token_ms"] / 1000)
+            else:
+                self._send_json({"model": request.get("model"), "message": message, "done": True})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    @staticmethod
+    def _embed(text: str, dim: int = 64) -> List[float]:
+        """Deterministic bag-of-words vector, so similar texts land close together."""
+        vector = np.zeros(dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+        return vector.tolist()
+
+    def _answer(self, request: Dict) -> Dict:
+        messages = request.get("messages") or []
+        query = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        has_search_data = any("internet data" in m.get("content", "") for m in messages if m.get("role") == "system")
+        needs_search = bool(self.server.search_pattern.search(query)) and not has_search_data
+
+        if request.get("format"):
+            # "json" planner
+            plan = {"internet": "yes" if needs_search else "no", "search_query": query if needs_search else ""}
+            return {"role": "assistant", "content": json.dumps(plan)}
+        if request.get("tools") and needs_search:
+            return {"role": "assistant", "content": "",
+                    "tool_calls": [{"function": {"name": "web_search", "arguments": {"query": query}}}]}
+        return {"role": "assistant", "content": STUB_ANSWER}
+
+    def _stream_message(self, model: str, message: Dict, token_delay: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(part: Dict) -> None:
+            line = (json.dumps(part) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+        if message.get("tool_calls"):
+            send({"model": model, "message": message, "done": False})
+        else:
+            for token in re.findall(r"\S+\s*", message["content"]):
+                send({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+                time.sleep(token_delay)
+        send({"model": model, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+class SearxngHandler(StubHandler):
+    """Mimics SearXNG's JSON search API and serves the result pages."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.count(url.path)
+        if url.path == "/search":
+            time.sleep(self.server.latencies["search_ms"] / 1000)
+            query = parse_qs(url.query).get("q", [""])[0]
+            self._send_json({"query": query, "answers": [], "results": [
+                {"url": f"{self.server.url}/page/{i}", "title": f"Result {i}",
+                 "content": f"Result {i} about {query} with a short snippet of relevant text."}
+                for i in range(config.SEARCH_TOP_N)
+            ]})
+        elif url.path.startswith("/page/"):
+            time.sleep(self.server.latencies["page_ms"] / 1000)
+            paragraphs = "".join(
+                f"<p>Paragraph {i} of the page has several words of ordinary content for passage ranking.</p>"
+                for i in range(40)
+            )
+            self._send_text(f"<html><body><nav>Home News Sports</nav><article>{paragraphs}</article></body></html>",
+                            "text/html; charset=utf-8")
+        else:
+            self.send_error(404)
+
+def silent_wav(seconds: float = 0.2, rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+class HeadlessUI:
+    """UIManager stand-in that records playback instead of opening an output device."""
+
+    def __init__(self):
+        self.is_speaking = False
+        self.current_playback = None
+        self.played: List[str] = []
+
+    def play_sound(self, sound_file: str):
+        from audio_output import PlaybackHandle
+
+        self.played.append(sound_file)
+        handle = PlaybackHandle(np.zeros(0, dtype=np.float32))
+        handle.done.set()
+        return handle
+
+    def stop_speech(self) -> None:
+        self.is_speaking = False
+
+    def send_notification(self, title: str, message: str) -> None:
+        pass
+
+def configure(args, workdir: str, ollama: StubServer, searxng: StubServer) -> None:
+    """Point the assistant at the stub services and keep its files out of the working tree."""
+    config.OLLAMA_HOST = ollama.url
+    config.SEARXNG_URL = f"{searxng.url}/search"
+    config.HISTORY_FILE = os.path.join(workdir, "conversation_history.json")
+    config.HISTORY_LOG_FILE = os.path.join(workdir, "conversation_history.jsonl")
+    config.MEMORY_DIR = os.path.join(workdir, "memory_index")
+    config.TRACE_FILE = os.path.join(workdir, "trace.jsonl")
+    config.TTS_CACHE_ENABLED = False
+    # Every turn goes to the model: cache hits and recall would make the results depend on corpus order
+    config.ANSWER_CACHE_ENABLED = False
+    config.MEMORY_ENABLED = False
+    config.TTS_BACKEND = "benchmark"
+    config.PLANNER_MODE = args.planner
+    config.VAD_AUTO_STOP = False  # The benchmark ends each recording itself
+    if args.stt_model:
+        config.STT_MODEL = args.stt_model
+
+def run_corpus(args) -> Dict[str, float]:
+    latencies = {
+        "llm_first_token_ms": args.llm_first_token_ms, "llm_token_ms": args.llm_token_ms,
+        "search_ms": args.search_ms, "page_ms": args.page_ms,
+    }
+    ollama = StubServer(OllamaHandler, latencies)
+    ollama.search_pattern = re.compile(args.search_pattern, re.IGNORECASE)
+    searxng = StubServer(SearxngHandler, latencies)
+    workdir = tempfile.mkdtemp(prefix="e2e_benchmark_")
+    configure(args, workdir, ollama, searxng)
+
+    # Imported after configure() so the modules pick up the stub endpoints
+    import tts_engine
+    from tracing import tracer
+    from audio_manager import AudioManager
+    from conversation_manager import ConversationManager
+    from llm_interface import LLMInterface
+    from pipeline import VoicePipeline
+
+    class BenchmarkTTSBackend(tts_engine.TTSBackend):
+        name = "benchmark"
+        extension = "wav"
+
+        def synthesize(self, text: str, voice: str) -> bytes:
+            time.sleep(args.tts_ms / 1000)
+            return silent_wav()
+
+    tts_engine.BACKENDS[BenchmarkTTSBackend.name] = BenchmarkTTSBackend
+
+    ui = HeadlessUI()
+    audio_manager = AudioManager(ui, capture=False)
+    audio_manager.stt.wait_until_loaded()
+    conversation_manager = ConversationManager()
+    llm_interface = LLMInterface(conversation_manager)
+
+    turn_done = threading.Event()
+    pipeline = VoicePipeline(audio_manager, llm_interface, ui, on_exit=lambda: None,
+                             on_turn_done=lambda turn: turn_done.set())
+    threading.Thread(target=lambda: asyncio.run(pipeline.run()), daemon=True).start()
+    while pipeline.loop is None:
+        time.sleep(0.01)
+
+    audio_seconds = 0.0
+    round_trips = []
+    for path in args.files:
+        audio = load_wav(path)
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        audio_seconds += len(pcm) / config.SAMPLE_RATE
+        with ollama.lock:
+            ollama.requests.clear()
+
+        audio_manager.start_recording()
+        chunk = audio_manager.chunk_size
+        for start in range(0, len(pcm), chunk):
+            audio_manager.handle_audio_chunk(pcm[start:start + chunk])
+            if args.realtime:
+                time.sleep(chunk / config.SAMPLE_RATE)
+        recording = audio_manager.stop_recording()
+
+        turn_done.clear()
+        pipeline.submit_recording(recording)
+        if not turn_done.wait(args.turn_timeout):
+            print(f"{path}: turn did not finish within {args.turn_timeout}s")
+        with ollama.lock:
+            round_trips.append(ollama.requests.get("/api/chat", 0))
+        if args.verbose:
+            print(f"  {path}: {round_trips[-1]} LLM round trips")
+
+    first_audio = [s * 1000 for s in tracer.durations.get("first_audio", [])]
+    transcription = sum(tracer.durations.get("transcription", []))
+    return {
+        "turns": len(args.files),
+        "time_to_first_audio_p50_ms": percentile(first_audio, 0.5),
+        "time_to_first_audio_p95_ms": percentile(first_audio, 0.95),
+        "stt_rtf": transcription / audio_seconds if audio_seconds else 0.0,
+        "llm_round_trips_per_turn": sum(round_trips) / len(round_trips) if round_trips else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Return a message for every metric that is worse than the baseline beyond the tolerance."""
+    regressions = []
+    for metric, value in results.items():
+        if metric == "turns" or metric not in baseline:
+            continue
+        allowed = baseline[metric] if metric == "llm_round_trips_per_turn" else baseline[metric] * (1 + tolerance)
+        if value > allowed + 1e-9:
+            regressions.append(f"{metric}: {value:.3f} > baseline {baseline[metric]:.3f}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay WAV utterances through the assistant against local stub services.")
+    parser.add_argument("files", nargs="+", help="16-bit PCM WAV utterances")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before failing")
+    parser.add_argument("--planner", default=config.PLANNER_MODE, choices=["tools", "json"])
+    parser.add_argument("--search-pattern", default=r"\b(weather|news|today|latest|price)\b",
+                        help="Queries matching this regex make the stub model ask for a web search")
+    parser.add_argument("--stt-model", help="Override STT_MODEL")
+    parser.add_argument("--llm-first-token-ms", type=float, default=150)
+    parser.add_argument("--llm-token-ms", type=float, default=15)
+    parser.add_argument("--search-ms", type=float, default=80)
+    parser.add_argument("--page-ms", type=float, default=120)
+    parser.add_argument("--tts-ms", type=float, default=100)
+    parser.add_argument("--realtime", action="store_true", help="Feed audio at real-time speed (exercises streaming STT)")
+    parser.add_argument("--turn-timeout", type=float, default=120)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    results = run_corpus(args)
+    print(f"{'metric':<32}{'value':>12}")
+    for metric, value in results.items():
+        print(f"{metric:<32}{value:>12.3f}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
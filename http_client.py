@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from config import OLLAMA_HOST, OLLAMA_KEEP_ALIVE, HTTP_ENDPOINTS, WEB_USER_AGENT
+
+class ServerError(Exception):
+    """A 5xx response, retried like a failed connection."""
+
+# Only failures before the request was accepted are retried; a read timeout already
+# cost a full read_timeout, and retrying it would multiply the stall
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, ConnectionError, ServerError)
+
+class HTTPTransport:
+    def __init__(self):
+        """Shared HTTP layer for SearXNG, result pages and Ollama.
+
+        All requests run on one background event loop with a pooled,
+        keep-alive client per endpoint, so connections are reused across
+        turns no matter which thread or event loop the caller uses. Each
+        endpoint has its own timeouts, retry budget and concurrency limit
+        (see HTTP_ENDPOINTS in config.py). Ollama calls ask the server to
+        keep the model loaded for OLLAMA_KEEP_ALIVE.
+        """
+        self.last_ollama_call = time.monotonic()  # Lets the residency manager tell when Ollama is idle
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self) -> None:
+        """Create clients and semaphores on the transport loop."""
+        import ollama
+
+        self.settings = HTTP_ENDPOINTS
+        self.semaphores = {
+            name: asyncio.Semaphore(settings["max_concurrency"])
+            for name, settings in self.settings.items()
+        }
+        self.clients: Dict[str, httpx.AsyncClient] = {
+            "searxng": httpx.AsyncClient(**self._client_options("searxng")),
+            # Result pages: follow redirects and look like a regular browser
+            "web": httpx.AsyncClient(
+                follow_redirects=True,
+                headers={"User-Agent": WEB_USER_AGENT},
+                **self._client_options("web")
+            ),
+        }
+        self.ollama = ollama.AsyncClient(host=OLLAMA_HOST, **self._client_options("ollama"))
+
+    def _client_options(self, endpoint: str) -> Dict[str, Any]:
+        settings = self.settings[endpoint]
+        return {
+            "timeout": httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"]),
+            "limits": httpx.Limits(
+                max_connections=settings["max_concurrency"],
+                max_keepalive_connections=settings["max_concurrency"]
+            ),
+        }
+
+    async def _on_loop(self, coro) -> Any:
+        """Run a coroutine on the transport loop and await its result from any loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def _with_retries(self, endpoint: str, call) -> Any:
+        """Run call() under the endpoint's concurrency limit, retrying transient failures."""
+        retries = self.settings[endpoint]["retries"]
+        async with self.semaphores[endpoint]:
+            for attempt in range(retries + 1):
+                try:
+                    return await call()
+                except RETRYABLE_ERRORS as e:
+                    if attempt == retries:
+                        raise
+                    print(f"[HTTP] {endpoint} request failed ({e!r}), retrying...")
+                await asyncio.sleep(0.2 * 2 ** attempt)
+
+    async def get(self, endpoint: str, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """GET a URL through an endpoint's pooled client; params are URL-encoded."""
+        client = self.clients[endpoint]
+
+        async def call():
+            response = await client.get(url, params=params)
+            if response.status_code >= 500:
+                # Treat server errors as transient so they are retried
+                raise ServerError(f"HTTP {response.status_code}")
+            return response
+
+        return await self._on_loop(self._with_retries(endpoint, call))
+
+    async def _ollama_call(self, method: str, **kwargs: Any) -> Any:
+        """Call an Ollama client method, turning its 5xx errors into retryable ServerErrors."""
+        import ollama
+
+        try:
+            if kwargs.get("stream"):
+                stream = await getattr(self.ollama, method)(**kwargs)
+                # The request is only sent when the first part is read
+                return stream, await stream.__anext__()
+            return await getattr(self.ollama, method)(**kwargs)
+        except ollama.ResponseError as e:
+            if e.status_code >= 500:
+                raise ServerError(f"Ollama HTTP {e.status_code}: {e.error}") from e
+            raise
+
+    def _ollama_options(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        self.last_ollama_call = time.monotonic()
+        kwargs.setdefault("keep_alive", OLLAMA_KEEP_ALIVE)
+        return kwargs
+
+    async def ollama_chat(self, **kwargs: Any) -> Any:
+        """Non-streaming Ollama chat call."""
+        kwargs = self._ollama_options(kwargs)
+        return await self._on_loop(self._with_retries("ollama", lambda: self._ollama_call("chat", **kwargs)))
+
+    async def ollama_generate(self, **kwargs: Any) -> Any:
+        """Non-streaming Ollama generate call."""
+        kwargs = self._ollama_options(kwargs)
+        return await self._on_loop(self._with_retries("ollama", lambda: self._ollama_call("generate", **kwargs)))
+
+    async def ollama_embed(self, **kwargs: Any) -> Any:
+        """Ollama embedding call."""
+        kwargs = self._ollama_options(kwargs)
+        return await self._on_loop(self._with_retries("ollama", lambda: self._ollama_call("embed", **kwargs)))
+
+    async def ollama_ps(self) -> Any:
+        """Models Ollama currently has loaded, with their memory use."""
+        return await self._on_loop(self._with_retries("ollama", lambda: self._ollama_call("ps")))
+
+    async def ollama_chat_stream(self, **kwargs: Any) -> AsyncIterator[Any]:
+        """Stream an Ollama chat; closing the iterator aborts the request."""
+        kwargs = self._ollama_options(kwargs)
+        caller_loop = asyncio.get_running_loop()
+        parts: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def put(item) -> None:
+            try:
+                caller_loop.call_soon_threadsafe(parts.put_nowait, item)
+            except RuntimeError:
+                pass  # Caller's event loop already closed
+
+        async def pump() -> None:
+            try:
+                async with self.semaphores["ollama"]:
+                    # Only opening the stream is retried; a half-read answer is not replayed
+                    for attempt in range(self.settings["ollama"]["retries"] + 1):
+                        try:
+                            stream, first = await self._ollama_call("chat", stream=True, **kwargs)
+                            break
+                        except RETRYABLE_ERRORS:
+                            if attempt == self.settings["ollama"]["retries"]:
+                                raise
+                            await asyncio.sleep(0.2 * 2 ** attempt)
+                    put(first)
+                    async for part in stream:
+                        put(part)
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = await parts.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Cancelling the pump closes the HTTP response, so Ollama stops generating
+            future.cancel()
+
+_transport: Optional[HTTPTransport] = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> HTTPTransport:
+    """Return the shared transport, creating it on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport()
+        return _transport
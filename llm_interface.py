@@ -1,43 +1,307 @@
 import asyncio
+import contextvars
 import json
 import re
-import requests
-import ollama
-from typing import Dict, List, Optional, Any
-from llm_axe import Agent, OnlineAgent, OllamaChat
+import time
+from typing import AsyncIterator, Dict, List, Optional, Any
 
-from config import LLM_MODEL, CONVERSATION_CONTEXT, CITY, COUNTRY, DATE_STR
+from config import (
+    LLM_MODEL, SPECULATIVE_OFFLINE_ANSWER, ANSWER_CACHE_ENABLED, SEARCH_PAGE_METHOD, INTERNET_CONTEXT_TOKENS, PLANNER_MODE, PLANNER_NUM_PREDICT,
+    build_conversation_context, get_location, DATE_STR,
+)
+from http_client import get_transport
+from retrieval import Retriever
+from context_builder import ContextBuilder
+from answer_cache import AnswerCache
+from tracing import tracer
+from passage_ranker import select_passages, estimate_tokens
+
+# llm_axe is imported where it is used to keep startup fast
+
+# CUSTOMIZE: Tool offered to the model in the "tools" planner mode
+WEB_SEARCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "web_search",
+        "description": "Search the internet for current or real-time information such as news, weather, "
+                       "prices, sports results or recent events that you cannot know.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "An optimized web search query"}
+            },
+            "required": ["query"]
+        }
+    }
+}
+
+TOOL_PLANNER_INSTRUCTIONS = (
+    "If answering requires up-to-date or real-time information, call the web_search tool "
+    "instead of answering. Otherwise answer directly."
+)
+
+# CUSTOMIZE: Prompt and output schema for the "json" planner mode
+PLANNER_JSON_PROMPT = (
+    "Decide if the latest user query needs an internet search to be answered correctly. "
+    "Set internet to \"yes\" only for current events, weather, news, prices or other real-time facts, "
+    "and give an optimized search_query. Otherwise set internet to \"no\" and search_query to \"\"."
+)
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "internet": {"type": "string", "enum": ["yes", "no"]},
+        "search_query": {"type": "string"}
+    },
+    "required": ["internet", "search_query"]
+}
+
+# How the answer to the current query was produced; shared with tasks spawned while answering
+_answer_route: contextvars.ContextVar = contextvars.ContextVar("answer_route")
+
+def _mark_answer_route(flag: str) -> None:
+    """Record that the current answer used the internet or fell back to an error message."""
+    route = _answer_route.get(None)
+    if route is not None:
+        route[flag] = True
 
 class LLMInterface:
     def __init__(self, conversation_manager):
         """Initialize LLM interface with conversation context."""
         self.conversation_manager = conversation_manager
         self.ollama_model = LLM_MODEL
-        self.system_prompt = CONVERSATION_CONTEXT
-        
-        # Initialize LLM client
-        self.llm = OllamaChat(model=self.ollama_model)
+        self._llm = None
+        self.speculation_stats = {"hits": 0, "misses": 0}
+        self.retriever = Retriever()
+        self.context_builder = ContextBuilder(conversation_manager, self.ollama_model)
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
         
+    @property
+    def system_prompt(self) -> str:
+        """System prompt, rebuilt so a background location update is picked up."""
+        return build_conversation_context()
+    
+    @property
+    def llm(self):
+        """llm_axe chat client, created on first use."""
+        if self._llm is None:
+            from llm_axe import OllamaChat
+            self._llm = OllamaChat(model=self.ollama_model)
+        return self._llm
+    
     async def ask_llm(self, query: str) -> str:
         """Send a query to the appropriate LLM and get response."""
+        return "".join([chunk async for chunk in self.ask_llm_stream(query)]).strip()
+    
+    async def ask_llm_stream(self, query: str) -> AsyncIterator[str]:
+        """Send a query to the appropriate LLM and yield the response as it is generated."""
         print(f"[LLM] Processing query: {query}")
+        loop = asyncio.get_event_loop()
+        
+        if self.answer_cache is not None:
+            cached = await loop.run_in_executor(None, self.answer_cache.lookup, query)
+            if cached:
+                print("[CACHE] Answer cache hit, skipping the LLM")
+                # Same chunks as the original stream, so speech is segmented the same way
+                for chunk in cached:
+                    yield chunk
+                return
+        
+        route = {"internet": False, "failed": False}
+        _answer_route.set(route)
+        parts = []
+        async for chunk in self._route_query(query):
+            parts.append(chunk)
+            yield chunk
+        
+        # Only complete offline answers are reused; anything from a search may be out of date
+        if self.answer_cache is not None and not route["internet"] and not route["failed"]:
+            await loop.run_in_executor(None, self.answer_cache.store, query, parts)
+    
+    async def _route_query(self, query: str) -> AsyncIterator[str]:
+        """Answer offline or with internet data, depending on PLANNER_MODE."""
+        if PLANNER_MODE == "tools":
+            async for chunk in self._stream_tool_response(query):
+                yield chunk
+            return
+        
+        if SPECULATIVE_OFFLINE_ANSWER:
+            async for chunk in self._speculative_stream(query):
+                yield chunk
+            return
         
         # Get plan for internet usage
         plan_data = await self._get_internet_plan(query)
         
         # Choose method based on plan
-        if plan_data.get("internet") == "yes" and plan_data.get("search_query"):
+        if self._plan_uses_internet(plan_data):
             print(f"[LLM] Using model with internet context")
-            response = await self._get_internet_enhanced_response(query, plan_data["search_query"])
+            stream = self._stream_internet_enhanced_response(query, plan_data["search_query"])
         else:
             print(f"[LLM] Using local Ollama model")
-            response = await self._get_offline_response(query)
+            stream = self._stream_offline_response(query)
             
-        return response
+        async for chunk in stream:
+            yield chunk
+    
+    @staticmethod
+    def _plan_uses_internet(plan_data: Dict[str, str]) -> bool:
+        """Check whether a plan asks for an internet search."""
+        return plan_data.get("internet") == "yes" and bool(plan_data.get("search_query"))
+    
+    async def _speculative_stream(self, query: str) -> AsyncIterator[str]:
+        """Run the planner and the offline answer in parallel, keeping the offline answer if the plan allows it."""
+        chunks: asyncio.Queue = asyncio.Queue()
+        
+        async def prefetch_offline() -> None:
+            # Buffer the offline answer until the plan decides whether it is used
+            try:
+                async for chunk in self._stream_offline_response(query):
+                    chunks.put_nowait(chunk)
+            finally:
+                chunks.put_nowait(None)
+        
+        offline_task = asyncio.create_task(prefetch_offline())
+        try:
+            plan_data = await self._get_internet_plan(query)
+        except BaseException:
+            offline_task.cancel()
+            raise
+        
+        if self._plan_uses_internet(plan_data):
+            # Miss: drop the offline branch, which also closes its Ollama stream
+            offline_task.cancel()
+            self._record_speculation("misses")
+            print(f"[LLM] Speculation miss, using model with internet context")
+            async for chunk in self._stream_internet_enhanced_response(query, plan_data["search_query"]):
+                yield chunk
+            return
+        
+        self._record_speculation("hits")
+        print(f"[LLM] Speculation hit, using local Ollama model")
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            offline_task.cancel()
+    
+    def _record_speculation(self, outcome: str) -> None:
+        """Count a speculation hit or miss and publish the totals to the trace and /metrics."""
+        self.speculation_stats[outcome] += 1
+        for name, value in self.get_speculation_stats().items():
+            tracer.gauge(f"speculation_{name}", round(value, 3))
+    
+    def get_speculation_stats(self) -> Dict[str, float]:
+        """Return speculative execution hit/miss counts and hit rate."""
+        total = self.speculation_stats["hits"] + self.speculation_stats["misses"]
+        return {
+            **self.speculation_stats,
+            "hit_rate": self.speculation_stats["hits"] / total if total else 0.0,
+        }
+    
+    async def _stream_chat(self, messages: List[Dict[str, str]],
+                           tools: Optional[List[Dict[str, Any]]] = None,
+                           tool_calls: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[str]:
+        """Stream a chat completion from Ollama, yielding content chunks as they arrive.
+        
+        Closing or cancelling the consumer closes the HTTP stream, which makes
+        Ollama abandon the generation. When tools are given, the stream ends at
+        the first tool call, which is appended to tool_calls.
+        """
+        stream = get_transport().ollama_chat_stream(model=self.ollama_model, messages=messages, tools=tools)
+        start = time.perf_counter()
+        first_token = False
+        with tracer.span("generation", tools=bool(tools)) as span:
+            try:
+                async for part in stream:
+                    if not first_token:
+                        first_token = True
+                        tracer.record("first_token", time.perf_counter() - start)
+                    calls = part["message"].get("tool_calls")
+                    if calls:
+                        span["tool_call"] = True
+                        if tool_calls is not None:
+                            tool_calls.extend(calls)
+                        break
+                    yield part["message"]["content"]
+            finally:
+                await stream.aclose()
     
     async def _get_internet_plan(self, query: str) -> Dict[str, str]:
         """Determine if a query requires internet access and generate search query."""
+        with tracer.span("planning", mode=PLANNER_MODE) as span:
+            if PLANNER_MODE == "json":
+                plan = await self._get_json_plan(query)
+            else:
+                plan = await self._get_agent_plan(query)
+            span["internet"] = self._plan_uses_internet(plan)
+            return plan
+    
+    async def _get_json_plan(self, query: str) -> Dict[str, str]:
+        """Plan with a single short, schema-constrained Ollama call."""
         try:
+            messages = await self._build_messages(PLANNER_JSON_PROMPT, query)
+            response = await get_transport().ollama_chat(
+                model=self.ollama_model,
+                messages=messages,
+                format=PLAN_SCHEMA,
+                options={"num_predict": PLANNER_NUM_PREDICT, "temperature": 0}
+            )
+            
+            plan_response = response["message"]["content"]
+            print(f"[Plan Agent] Response: {repr(plan_response)}")
+            plan_data = json.loads(plan_response)
+            if not isinstance(plan_data, dict):
+                raise ValueError("Plan is not a JSON object.")
+            return plan_data
+        
+        except Exception as e:
+            # Answering offline is cheaper than an unneeded search
+            print(f"[LLM] Error determining internet plan: {e}. Answering offline.")
+            return {"internet": "no", "search_query": ""}
+    
+    async def _stream_tool_response(self, query: str) -> AsyncIterator[str]:
+        """Answer directly or call web_search, deciding in the same generation."""
+        tool_calls: List[Dict[str, Any]] = []
+        streamed = False
+        try:
+            messages = await self._build_messages(self.system_prompt + " " + TOOL_PLANNER_INSTRUCTIONS, query)
+            async for chunk in self._stream_chat(messages, tools=[WEB_SEARCH_TOOL], tool_calls=tool_calls):
+                streamed = True
+                yield chunk
+        except Exception as e:
+            print(f"[LLM] Error getting tool-planned response: {e}")
+            _mark_answer_route("failed")
+            if not streamed:
+                yield "I'm having trouble processing your request right now."
+            return
+        
+        for call in tool_calls:
+            function = call["function"]
+            if function["name"] == "web_search":
+                arguments = function.get("arguments") or {}
+                search_query = arguments.get("query") or query
+                print(f"[LLM] Model requested web search: {search_query}")
+                async for chunk in self._stream_internet_enhanced_response(query, search_query):
+                    yield chunk
+                return
+    
+    async def _build_messages(self, system_prompt: str, query: str, extra_context: Optional[str] = None) -> List[Dict[str, str]]:
+        """Format the system prompt, conversation history, extra context and query for the chat API."""
+        # Memory recall makes an embedding call, which must not block the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.context_builder.build, system_prompt, query, extra_context
+        )
+    
+    async def _get_agent_plan(self, query: str) -> Dict[str, str]:
+        """Plan with an llm_axe agent and a free-text JSON prompt."""
+        try:
+            from llm_axe import Agent
+            city, country = get_location()
+            
             # CUSTOMIZE: Planning agent prompt - controls when internet search is triggered
             planning_prompt = f"""
             You have one job: decide if the user query requires an internet search for an LLM like yourself.
@@ -46,7 +310,7 @@ class LLMInterface:
             - "search_query" must be a string: if internet is "yes", provide an optimized search query; if "no", use an empty string.
             Do NOT include any extra text, explanations, markdown, or symbols.
             Respond exactly with the JSON object only.
-            if you need the time in location, it is {CITY}, {COUNTRY}, {DATE_STR}
+            if you need the time in location, it is {city}, {country}, {DATE_STR}
             Example: {{{{ "internet": "yes", "search_query": "current weather in Seattle" }}}}
             
             You are just a plan agent, the responses in the history are not from you and you don't have anything to do with them.
@@ -98,83 +362,83 @@ class LLMInterface:
     
     async def _get_internet_enhanced_response(self, query: str, search_query: str) -> str:
         """Get a response with internet data enhancement."""
+        return "".join([chunk async for chunk in self._stream_internet_enhanced_response(query, search_query)]).strip()
+    
+    async def _stream_internet_enhanced_response(self, query: str, search_query: str) -> AsyncIterator[str]:
+        """Stream a response with internet data enhancement."""
+        streamed = False
+        _mark_answer_route("internet")
         try:
+            from llm_axe import OnlineAgent
+            
             method = None
             summary = None
             url = None
+            pages = []
             loop = asyncio.get_event_loop()
             
-            # CUSTOMIZE: Search service URL
+            # CUSTOMIZE: Search service URL is SEARXNG_URL in config.py
             # This requires running SearXNG search service on this port
-            search_url = f"http://localhost:8080/search?q={search_query}&format=json"
             
             # Get search results from local search service
             print(f"[LLM] Fetching real-time data for: {search_query}")
             
             try:
-                search_response = await loop.run_in_executor(None, requests.get, search_url)
+                search_results = await self.retriever.search(search_query)
+                urls = self.retriever.top_urls(search_results)
                 
-                if search_response.status_code == 200:
-                    raw_text = search_response.text.strip()
-                    
-                    if raw_text in ['"query"', 'query']:
-                        search_results = {}
+                # Process search results
+                if "answers" in search_results and search_results["answers"]:
+                    summary = search_results["answers"][0]
+                    method = "answers"
+                    print(f"[LLM] Answer Found: {summary}")
+                elif urls and SEARCH_PAGE_METHOD == "onlineagent":
+                    url = urls[0]
+                    method = "onlineagent"
+                    print(f"[LLM] Using URL from results: {url}")
+                elif urls:
+                    pages = await self.retriever.fetch_pages(urls)
+                    if pages:
+                        method = "pages"
+                        print(f"[LLM] Using {len(pages)} result pages: {', '.join(u for u, _ in pages)}")
                     else:
-                        try:
-                            search_results = json.loads(raw_text)
-                            if isinstance(search_results, str):
-                                search_results = {}
-                        except Exception:
-                            search_results = {}
-                    
-                    # Process search results
-                    if "answers" in search_results and search_results["answers"]:
-                        summary = search_results["answers"][0]
-                        method = "answers"
-                        print(f"[LLM] Answer Found: {summary}")
-                    elif ("results" in search_results and 
-                        isinstance(search_results["results"], list) and 
-                        len(search_results["results"]) > 0):
-                        first_result = search_results["results"][0]
-                        if isinstance(first_result, dict) and "url" in first_result:
-                            url = first_result["url"]
-                            method = "onlineagent"
-                            print(f"[LLM] Using URL from results: {url}")
-                        else:
-                            print("[LLM] Search result does not contain a valid URL.")
-                    else:
-                        print("[LLM] No usable search results found.")
+                        print("[LLM] No result pages could be fetched in time.")
+                else:
+                    print("[LLM] No usable search results found.")
             except Exception as e:
                 print(f"[LLM] Error fetching search results: {e}")
             
             # Process based on method
             if method == "answers":
-                # Add summary to prompt
-                enhanced_prompt = self.system_prompt + f" Additional internet data: {summary}"
-                
-                # Format conversation for the chat API
-                history = self.conversation_manager.get_recent_history()
-                messages = [{"role": "system", "content": enhanced_prompt}]
-                
-                # Add previous conversation turns
-                for i in range(len(history["user"])):
-                    messages.append({"role": "user", "content": history["user"][i]})
-                    if i < len(history["assistant"]):
-                        messages.append({"role": "assistant", "content": history["assistant"][i]})
+                # Add the direct answer plus the result snippets that best match the question
+                internet_data = f"Additional internet data: {summary}"
+                snippet_data = self._rank_internet_data(
+                    query, search_query, self.retriever.snippets(search_results),
+                    INTERNET_CONTEXT_TOKENS - estimate_tokens(summary)
+                )
+                if snippet_data:
+                    internet_data += f"\n{snippet_data}"
                 
-                # Add current query
-                messages.append({"role": "user", "content": query})
+                # Search data follows the history so the cached prompt prefix stays valid
+                messages = await self._build_messages(self.system_prompt, query, internet_data)
                 
                 # CUSTOMIZE: Model parameters for internet-enhanced responses
-                response = await loop.run_in_executor(
-                    None, 
-                    lambda: ollama.chat(
-                        model=self.ollama_model,
-                        messages=messages
-                    )
+                async for chunk in self._stream_chat(messages):
+                    streamed = True
+                    yield chunk
+                
+            elif method == "pages":
+                # Add only the passages that best match the question to the prompt
+                page_data = self._rank_internet_data(
+                    query, search_query, pages + self.retriever.snippets(search_results), INTERNET_CONTEXT_TOKENS
+                )
+                messages = await self._build_messages(
+                    self.system_prompt, query, f"Additional internet data from search results:\n{page_data}"
                 )
                 
-                return response["message"]["content"].strip()
+                async for chunk in self._stream_chat(messages):
+                    streamed = True
+                    yield chunk
                 
             elif method == "onlineagent":
                 # Use OnlineAgent to extract info from the URL
@@ -189,50 +453,48 @@ class LLMInterface:
                 
                 # Clean up the response
                 cleaned_answer = online_answer.replace('Based to the information from the internet,', '')
-                return cleaned_answer
+                streamed = True
+                yield cleaned_answer
                 
             else:
                 # Fall back to offline response if no internet data found
-                return await self._get_offline_response(query)
+                async for chunk in self._stream_offline_response(query):
+                    streamed = True
+                    yield chunk
                 
         except Exception as e:
             print(f"[LLM] Error getting internet-enhanced response: {e}")
-            return "Sorry, I'm having trouble retrieving information from the internet right now."
+            _mark_answer_route("failed")
+            if not streamed:
+                yield "Sorry, I'm having trouble retrieving information from the internet right now."
+    
+    def _rank_internet_data(self, query: str, search_query: str, sources: List[tuple], token_budget: int) -> str:
+        """Format the best-matching passages from (url, text) sources within a token budget."""
+        passages = select_passages(f"{query} {search_query}", sources, max(0, token_budget))
+        print(f"[LLM] Using {len(passages)} passages from {len({url for url, _ in passages})} sources")
+        return "\n\n".join(f"[{i + 1}] {url}\n{passage}" for i, (url, passage) in enumerate(passages))
     
     async def _get_offline_response(self, query: str) -> str:
         """Get response from local Ollama model."""
+        return "".join([chunk async for chunk in self._stream_offline_response(query)])
+    
+    async def _stream_offline_response(self, query: str) -> AsyncIterator[str]:
+        """Stream a response from the local Ollama model."""
+        streamed = False
         try:
-            # Get recent conversation history
-            history = self.conversation_manager.get_recent_history()
-            
-            # Format conversation for the chat API
-            messages = [{"role": "system", "content": self.system_prompt}]
-            
-            # Add previous conversation turns
-            for i in range(len(history["user"])):
-                messages.append({"role": "user", "content": history["user"][i]})
-                if i < len(history["assistant"]):
-                    messages.append({"role": "assistant", "content": history["assistant"][i]})
-            
-            # Add current query
-            messages.append({"role": "user", "content": query})
+            # Format conversation with recent history for the chat API
+            messages = await self._build_messages(self.system_prompt, query)
             
             # CUSTOMIZE: Model parameters for regular responses
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                lambda: ollama.chat(
-                    model=self.ollama_model,
-                    messages=messages
-                )
-            )
-            
-            # Extract the response text
-            return response['message']['content']
+            async for chunk in self._stream_chat(messages):
+                streamed = True
+                yield chunk
             
         except Exception as e:
             print(f"[LLM] Error getting offline response: {e}")
-            return "I'm having trouble processing your request right now."
+            _mark_answer_route("failed")
+            if not streamed:
+                yield "I'm having trouble processing your request right now."
     
     def update_conversation(self, user_input: str, assistant_response: str) -> None:
         """Update conversation history with the latest exchange."""
@@ -1,17 +1,18 @@
+from startup_timer import startup_timer
+
 import os
 import asyncio
-import tempfile
-import keyboard
-import numpy as np
-import soundfile as sf
 import warnings
-import time
 
-from ui_manager import UIManager
-from audio_manager import AudioManager
-from llm_interface import LLMInterface
-from conversation_manager import ConversationManager
-from config import EXIT_COMMANDS
+with startup_timer.phase("imports"):
+    import keyboard
+    from ui_manager import UIManager
+    from audio_manager import AudioManager
+    from llm_interface import LLMInterface
+    from conversation_manager import ConversationManager
+    from pipeline import VoicePipeline
+    from model_residency import ModelResidency
+    from tracing import tracer
 
 # Suppress Whisper model warnings
 warnings.filterwarnings("ignore", message="You are using `torch.load` with `weights_only=False`")
@@ -22,10 +23,29 @@ class VoiceAssistant:
     def __init__(self):
         """Initialize the voice assistant components."""
         print("[INIT] Initializing Voice Assistant components...")
-        self.ui_manager = UIManager()
-        self.conversation_manager = ConversationManager()
-        self.audio_manager = AudioManager(self.ui_manager)
-        self.llm_interface = LLMInterface(self.conversation_manager)
+        with startup_timer.phase("ui manager"):
+            self.ui_manager = UIManager()
+        with startup_timer.phase("conversation history"):
+            self.conversation_manager = ConversationManager()
+        with startup_timer.phase("audio capture"):
+            self.audio_manager = AudioManager(self.ui_manager)
+        with startup_timer.phase("llm interface"):
+            self.llm_interface = LLMInterface(self.conversation_manager)
+        
+        # Load the Ollama models while the rest of the assistant starts and keep them loaded
+        self.residency = ModelResidency(self.audio_manager.stt)
+        self.residency.start()
+        
+        # Transcription, answering and speech run as stages on one event loop
+        self.pipeline = VoicePipeline(self.audio_manager, self.llm_interface, self.ui_manager, self.shutdown)
+        
+        # Prometheus metrics, if METRICS_PORT is set in config.py
+        tracer.serve_metrics()
+        
+        # Voice activity detection ends recordings on trailing silence
+        self.audio_manager.on_endpoint = self.process_recording
+        # Talking over the assistant cancels its answer; the audio manager is already recording
+        self.audio_manager.on_barge_in = self.pipeline.barge_in
         
         self.shutting_down = False
         
@@ -37,8 +57,8 @@ class VoiceAssistant:
         
     def toggle_recording(self):
         """Toggle recording or stop speech if speaking."""
-        if self.ui_manager.is_speaking and self.ui_manager.tts_process is not None:
-            self.ui_manager.stop_speech()
+        if self.ui_manager.is_speaking:
+            self.pipeline.stop_speech()
             return
         
         if not self.audio_manager.recording:
@@ -52,57 +72,24 @@ class VoiceAssistant:
         self.ui_manager.play_sound("confirmation.mp3")
         
     def process_recording(self):
-        """Process recorded audio and get AI response."""
-        self.audio_manager.stop_recording()
-        self.ui_manager.play_sound("confirmation.mp3")
-        
-        audio_file = self.audio_manager.save_recording()
-        if not audio_file:
-            print("[ERROR] No audio recorded")
-            return
-            
-        user_text, detected_lang = self.audio_manager.transcribe_audio(audio_file)
-        os.remove(audio_file)
-            
-        print(f"[You]: {user_text}")
-        
-        # Check for exit commands
-        if user_text.lower() in EXIT_COMMANDS:
-            print("[Assistant]: Goodbye!")
-            asyncio.run(self.audio_manager.text_to_speech("Goodbye!", "en"))
-            self.shutdown()
+        """Finish the recording and hand it to the pipeline for transcription and a response."""
+        # Either the hotkey or automatic endpointing may get here first
+        recording = self.audio_manager.stop_recording()
+        if recording is None:
             return
-            
-        self.process_query(user_text)
-        
-    async def process_query_async(self, query):
-        """Get LLM response and speak it."""
-        response = await self.llm_interface.ask_llm(query)
-        print(f"[Assistant]: {response}")
-        
-        self.llm_interface.update_conversation(query, response)
-        
-        # Detect response language for TTS
-        try:
-            from langdetect import detect
-            lang_code = detect(response)
-            lang_code = "en" if lang_code == "en" else lang_code
-        except Exception as e:
-            print(f"[Language Detection] Error: {e}")
-            lang_code = "en"
-            
-        self.ui_manager.send_notification("Voice Assistant", response)
-        self.audio_manager.text_to_speech(response, lang_code)
-        
-    def process_query(self, query):
-        """Process user query synchronously."""
-        asyncio.run(self.process_query_async(query))
+        self.ui_manager.play_sound("confirmation.mp3")
+        self.pipeline.submit_recording(recording)
         
     def shutdown(self):
         """Clean up resources and exit."""
         self.shutting_down = True
+        self.pipeline.stop()
         self.ui_manager.send_notification("Shutting Down", "Goodbye!")
-        self.ui_manager.play_sound("close.wav")
+        # Playback runs on the output stream, so let the sound finish before exiting
+        closing = self.ui_manager.play_sound("close.wav")
+        if closing is not None:
+            closing.wait(timeout=2.0)
+        self.conversation_manager.close()
         self.audio_manager.cleanup()
         os._exit(0)
         
@@ -112,10 +99,11 @@ class VoiceAssistant:
         keyboard.add_hotkey('alt', self.toggle_recording)
         
         print("[INIT] Running... (Press ESC to exit)")
+        startup_timer.mark_ready()
         try:
-            while not self.shutting_down:
-                self.audio_manager.record_audio_frame()
-                time.sleep(0.01)  # Prevent CPU overload
+            # The main thread runs the event loop for every turn; audio is captured on a
+            # background thread and the hotkey and endpointer hand work to the loop
+            asyncio.run(self.pipeline.run())
         except KeyboardInterrupt:
             print("\n[KEYBOARD] Interrupted by user")
             self.shutdown()
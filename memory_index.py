@@ -0,0 +1,186 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import EMBED_MODEL, MEMORY_DIR, MEMORY_TOP_K, MEMORY_MIN_SIMILARITY, MEMORY_RECALL_TIMEOUT
+from http_client import get_transport
+
+def embed_texts(texts: List[str], model: str = EMBED_MODEL, timeout: Optional[float] = None) -> np.ndarray:
+    """Embed texts with Ollama and return L2-normalized float32 rows.
+
+    Blocks the calling thread, so call it from a worker thread rather than
+    an event loop; the request runs on the shared transport loop. Raises
+    concurrent.futures.TimeoutError after timeout seconds, e.g. while the
+    Ollama connections are busy generating.
+    """
+    transport = get_transport()
+    future = asyncio.run_coroutine_threadsafe(transport.ollama_embed(model=model, input=texts), transport.loop)
+    try:
+        response = future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+    vectors = np.asarray(response["embeddings"], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+_last_query: Optional[Tuple[str, str, np.ndarray]] = None  # (model, text, vector)
+
+def embed_query(text: str, model: str = EMBED_MODEL, timeout: Optional[float] = None) -> np.ndarray:
+    """Embed one query, reusing the previous result when the same text is looked up again.
+
+    The planner, the offline answer, the answer cache and memory recall all
+    look up the same question, so this saves an embedding call for each.
+    """
+    global _last_query
+    cached = _last_query
+    if cached and cached[0] == model and cached[1] == text:
+        return cached[2]
+    vector = embed_texts([text], model, timeout)[0]
+    _last_query = (model, text, vector)
+    return vector
+
+class MemoryIndex:
+    def __init__(self, directory: str = MEMORY_DIR, model: str = EMBED_MODEL):
+        """Long-term memory of every conversation turn, searchable by meaning.
+
+        Turn texts are appended to turns.jsonl and their embeddings to
+        vectors.f32, a raw float32 matrix that is memory-mapped for search,
+        so the whole history is scored with one matrix-vector product
+        without being loaded into memory. New turns are embedded on a
+        background thread.
+        """
+        self.directory = directory
+        self.model = model
+        self.turns_path = os.path.join(directory, "turns.jsonl")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock = threading.Lock()
+        self.turns: List[Dict[str, str]] = []
+        self.dim = 0
+        self.matrix: Optional[np.ndarray] = None
+        self.enabled = True
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self.additions: "queue.Queue[Optional[Dict[str, str]]]" = queue.Queue()  # None stops the indexer
+        self.indexer = threading.Thread(target=self._index_loop, daemon=True)
+        self.indexer.start()
+
+    def _load(self) -> None:
+        """Open the stored index, discarding it if it was built with another embedding model."""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("model") != self.model:
+            for path in (self.turns_path, self.vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        self.dim = meta["dim"]
+        if not os.path.exists(self.turns_path) or not os.path.exists(self.vectors_path):
+            open(self.turns_path, "w").close()
+            open(self.vectors_path, "wb").close()
+        with open(self.turns_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self.turns.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # Partial line from an interrupted write
+        # Trust only rows present in both files
+        rows = min(len(self.turns), os.path.getsize(self.vectors_path) // (4 * self.dim))
+        del self.turns[rows:]
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(rows * 4 * self.dim)
+        self._remap()
+        print(f"[MEMORY] Loaded {rows} remembered turns")
+
+    def _remap(self) -> None:
+        rows = len(self.turns)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add(self, user: str, assistant: str) -> None:
+        """Queue a turn for embedding and storage."""
+        if self.enabled:
+            self.additions.put({"user": user, "assistant": assistant})
+
+    def close(self) -> None:
+        """Index the turns still queued and stop the indexer thread."""
+        self.additions.put(None)
+        self.indexer.join(timeout=5)
+
+    def _index_loop(self) -> None:
+        while True:
+            turns = [self.additions.get()]
+            while not self.additions.empty():
+                turns.append(self.additions.get_nowait())
+            closing = None in turns
+            turns = [t for t in turns if t is not None]
+            if turns:
+                try:
+                    vectors = embed_texts([f"User: {t['user']}\nAssistant: {t['assistant']}" for t in turns], self.model)
+                    self._append(turns, vectors)
+                except Exception as e:
+                    print(f"[MEMORY] Could not index turns with '{self.model}': {e}")
+            if closing:
+                return
+
+    def _append(self, turns: List[Dict[str, str]], vectors: np.ndarray) -> None:
+        with self.lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self.dim}, f)
+            # Vectors first: on a crash, rows without a turn line are cut off at load
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.turns_path, "a", encoding="utf-8") as f:
+                for turn in turns:
+                    f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+            self.turns.extend(turns)
+            self._remap()
+
+    def search(self, query: str, k: int = MEMORY_TOP_K, exclude: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """Return up to k stored turns most similar to the query, best first.
+
+        Turns whose user text is in exclude (typically the ones already in
+        the prompt) are skipped.
+        """
+        if not self.enabled or self.matrix is None:
+            return []
+        try:
+            query_vector = embed_query(query, self.model, MEMORY_RECALL_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            print("[MEMORY] Embedding took too long, answering without recall")
+            return []
+        except Exception as e:
+            print(f"[MEMORY] Search disabled, embedding failed: {e}")
+            self.enabled = False
+            return []
+
+        with self.lock:
+            matrix, turns = self.matrix, list(self.turns)
+        scores = matrix @ query_vector
+        count = min(len(scores), k + len(exclude or []))
+        top = np.argpartition(-scores, count - 1)[:count]
+        skip = set(exclude or [])
+
+        results = []
+        for index in top[np.argsort(-scores[top])]:
+            if scores[index] < MEMORY_MIN_SIMILARITY or len(results) >= k:
+                break
+            if turns[index]["user"] not in skip:
+                results.append(turns[index])
+        return results
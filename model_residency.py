@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    LLM_MODEL, EMBED_MODEL, MEMORY_ENABLED, ANSWER_CACHE_ENABLED, OLLAMA_REWARM_SECONDS,
+)
+from http_client import get_transport
+from startup_timer import startup_timer
+from stt_backends import STTBackend
+from tracing import tracer
+
+MB = 1024 * 1024
+
+class ModelResidency:
+    def __init__(self, stt: Optional[STTBackend] = None, models: Optional[List[str]] = None):
+        """Keeps the models the assistant needs loaded and reports their memory.
+
+        The Ollama models are warmed up at startup and again whenever no
+        Ollama call has been made for OLLAMA_REWARM_SECONDS, which also
+        reloads a model Ollama evicted in the meantime. Every request carries
+        OLLAMA_KEEP_ALIVE (see http_client.py). Resident memory per model
+        (Ollama's own numbers, and the speech-to-text weights) is printed
+        after warm-up and kept up to date as model_ram_mb/model_vram_mb gauges.
+        """
+        self.stt = stt
+        if models is None:
+            models = [LLM_MODEL]
+            if MEMORY_ENABLED or ANSWER_CACHE_ENABLED:
+                models.append(EMBED_MODEL)
+        self.models = models
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def warm_up(self, model: str) -> None:
+        """Ask Ollama to load a model so the next query does not pay for it."""
+        transport = get_transport()
+        try:
+            if model == EMBED_MODEL:
+                asyncio.run(transport.ollama_embed(model=model, input="warm up"))
+            else:
+                # An empty prompt only loads the model, it does not generate anything
+                asyncio.run(transport.ollama_generate(model=model, prompt=""))
+            print(f"[MODELS] {model} loaded.")
+        except Exception as e:
+            print(f"[MODELS] Warm-up of {model} failed: {e}")
+
+    def memory_report(self) -> Dict[str, Dict[str, float]]:
+        """Resident memory in MB per loaded model, split into RAM and VRAM."""
+        report: Dict[str, Dict[str, float]] = {}
+        if self.stt is not None:
+            resident = self.stt.resident_mb()
+            if resident is not None:
+                report[f"stt:{self.stt.name}"] = {"ram_mb": resident, "vram_mb": 0.0}
+        try:
+            loaded = asyncio.run(get_transport().ollama_ps())
+            for model in loaded["models"]:
+                size, vram = model["size"] / MB, model["size_vram"] / MB
+                report[f"ollama:{model['name']}"] = {"ram_mb": size - vram, "vram_mb": vram}
+        except Exception as e:
+            print(f"[MODELS] Could not list Ollama models: {e}")
+        return report
+
+    def _publish(self, show: bool = False) -> None:
+        for name, usage in self.memory_report().items():
+            tracer.gauge("model_ram_mb", round(usage["ram_mb"], 1), model=name)
+            tracer.gauge("model_vram_mb", round(usage["vram_mb"], 1), model=name)
+            if show:
+                print(f"[MODELS] {name}: {usage['ram_mb']:.0f} MB RAM, {usage['vram_mb']:.0f} MB VRAM")
+
+    def _run(self) -> None:
+        with startup_timer.background("ollama warm-up"):
+            for model in self.models:
+                self.warm_up(model)
+        if self.stt is not None:
+            try:
+                self.stt.wait_until_loaded()
+            except RuntimeError:
+                pass  # Already reported by the loader
+        self._publish(show=True)
+
+        interval = min(60, OLLAMA_REWARM_SECONDS) if OLLAMA_REWARM_SECONDS else 60
+        while not self.stopped.wait(interval):
+            idle = time.monotonic() - get_transport().last_ollama_call
+            if OLLAMA_REWARM_SECONDS and idle >= OLLAMA_REWARM_SECONDS:
+                print(f"[MODELS] Idle for {idle / 60:.0f} min, warming models up again")
+                for model in self.models:
+                    self.warm_up(model)
+            self._publish()
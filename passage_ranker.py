@@ -0,0 +1,95 @@
+import re
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+from config import (
+    PASSAGE_WORDS,
+    PASSAGE_OVERLAP_WORDS,
+    PASSAGE_MIN_LINE_WORDS,
+    BM25_K1,
+    BM25_B,
+)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "how", "i",
+    "in", "is", "it", "its", "me", "my", "of", "on", "or", "that", "the", "this", "to", "was",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+def split_passages(text: str, words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP_WORDS) -> List[str]:
+    """Drop boilerplate lines and split the remaining text into overlapping word windows.
+
+    Lines with fewer than PASSAGE_MIN_LINE_WORDS words are mostly menus,
+    buttons, cookie notices and link lists, so they are discarded first.
+    """
+    content = [line for line in text.splitlines() if len(line.split()) >= PASSAGE_MIN_LINE_WORDS]
+    tokens = " ".join(content).split()
+    if not tokens:
+        return []
+
+    step = max(1, words - overlap)
+    passages = []
+    for start in range(0, len(tokens), step):
+        passages.append(" ".join(tokens[start:start + words]))
+        if start + words >= len(tokens):
+            break
+    return passages
+
+def bm25_scores(query: str, passages: List[str], k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """Score passages against the query with BM25.
+
+    Term statistics are gathered into a (passages x query terms) frequency
+    matrix so IDF and saturation are computed in a few array operations.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not passages:
+        return np.zeros(len(passages), dtype=np.float32)
+
+    tf = np.zeros((len(passages), len(terms)), dtype=np.float32)
+    lengths = np.zeros(len(passages), dtype=np.float32)
+    for i, passage in enumerate(passages):
+        counts = Counter(tokenize(passage))
+        lengths[i] = sum(counts.values())
+        tf[i] = [counts.get(term, 0) for term in terms]
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(passages) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1.0 - b + b * lengths / max(float(lengths.mean()), 1.0))
+    return ((tf * (k1 + 1.0)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+def select_passages(query: str, sources: List[Tuple[str, str]], token_budget: int) -> List[Tuple[str, str]]:
+    """Return the best (source, passage) pairs for the query that fit in token_budget.
+
+    sources is a list of (source label, text). Passages are taken in score
+    order until the budget is full; passages with no query term are skipped
+    unless nothing matches at all, in which case sources keep their order.
+    """
+    candidates = [(label, passage) for label, text in sources for passage in split_passages(text)]
+    if not candidates:
+        return []
+
+    scores = bm25_scores(query, [passage for _, passage in candidates])
+    order = np.argsort(-scores, kind="stable") if scores.any() else np.arange(len(candidates))
+    selected = []
+    used = 0
+    for index in order:
+        if scores.any() and scores[index] <= 0:
+            break
+        cost = estimate_tokens(candidates[index][1])
+        if used + cost > token_budget:
+            continue
+        selected.append(candidates[index])
+        used += cost
+    return selected
@@ -0,0 +1,258 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from config import EXIT_COMMANDS, PIPELINE_QUERY_QUEUE, PIPELINE_SEGMENT_QUEUE, PIPELINE_AUDIO_QUEUE, PIPELINE_PLAYBACK_AHEAD
+from text_segmenter import SentenceSegmenter
+from audio_output import PlaybackHandle
+from tracing import tracer, current_turn
+
+class Turn:
+    _ids = itertools.count(1)
+
+    def __init__(self, query: str, lang: str = "en", started_at: Optional[float] = None):
+        """One user query on its way through the pipeline."""
+        self.id = next(self._ids)
+        self.started_at = started_at or time.perf_counter()  # When the recording was handed over
+        self.first_audio_recorded = False
+        self.query = query
+        self.lang = lang
+        self.voice_lang: Optional[str] = None  # Picked from the first spoken segment
+        self.cancelled = False
+        self.done = asyncio.Event()  # Set once the last segment has played or the turn was cancelled
+
+class VoicePipeline:
+    def __init__(self, audio_manager, llm_interface, ui_manager, on_exit: Callable[[], None],
+                 on_turn_done: Optional[Callable[[Optional[Turn]], None]] = None):
+        """Runs every turn on one long-lived event loop.
+
+        Transcription, generation, synthesis and playback are stages joined
+        by bounded queues, so each stage works on its own item while the
+        next one is busy, and a slow stage holds back the ones feeding it
+        instead of letting work pile up. Blocking calls (Whisper, TTS) run in
+        the default executor. A new utterance or stop_speech() cancels the
+        turn in flight: its generation task is cancelled and items of that
+        turn still queued are dropped.
+
+        on_turn_done is called on the loop once a turn has been spoken or
+        cancelled, and with None when a recording contained no speech.
+        """
+        self.audio_manager = audio_manager
+        self.llm_interface = llm_interface
+        self.ui_manager = ui_manager
+        self.on_exit = on_exit
+        self.on_turn_done = on_turn_done
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.current: Optional[Turn] = None
+        self.answer_task: Optional[asyncio.Task] = None
+        self.playing: Deque[PlaybackHandle] = deque()  # Segments queued on the output stream
+
+    async def run(self) -> None:
+        """Start the stages and run until stop() is called."""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        # Finished recordings with their hand-over times
+        self.utterances: "asyncio.Queue[Tuple[Any, float]]" = asyncio.Queue(maxsize=1)
+        self.queries: "asyncio.Queue[Turn]" = asyncio.Queue(maxsize=PIPELINE_QUERY_QUEUE)
+        self.segments: "asyncio.Queue[Tuple[Turn, Optional[str]]]" = asyncio.Queue(maxsize=PIPELINE_SEGMENT_QUEUE)
+        self.audio: "asyncio.Queue[Tuple[Turn, Optional[str]]]" = asyncio.Queue(maxsize=PIPELINE_AUDIO_QUEUE)
+
+        stages = [
+            asyncio.create_task(self._stage(self._transcribe, self.utterances)),
+            asyncio.create_task(self._stage(self._answer, self.queries)),
+            asyncio.create_task(self._stage(self._synthesize, self.segments)),
+            asyncio.create_task(self._stage(self._play, self.audio)),
+        ]
+        try:
+            await self.stopped.wait()
+        finally:
+            for task in stages:
+                task.cancel()
+
+    # Entry points for other threads (hotkey, endpointer, barge-in)
+
+    def submit_recording(self, recording) -> None:
+        """Hand a recording returned by AudioManager.stop_recording() to the transcription stage."""
+        self._call_soon(lambda: self._put_utterance(recording))
+
+    def stop_speech(self) -> None:
+        """Cancel the turn that is being answered or spoken."""
+        self._call_soon(self._cancel_current)
+
+    def barge_in(self, onset: float) -> None:
+        """Cancel the turn being spoken because the user started talking at onset (perf_counter time)."""
+        self._call_soon(lambda: self._barge_in(onset))
+
+    def stop(self) -> None:
+        """Stop the stages and make run() return."""
+        self._call_soon(lambda: self.stopped.set())
+
+    def _call_soon(self, callback) -> None:
+        if self.loop is None or self.loop.is_closed():
+            return  # Not running yet, or already shut down
+        self.loop.call_soon_threadsafe(callback)
+
+    def _put_utterance(self, recording) -> None:
+        # Only the latest recording matters; the queue holds at most one
+        if not self.utterances.full():
+            self.utterances.put_nowait((recording, time.perf_counter()))
+
+    def _cancel_current(self) -> None:
+        turn = self.current
+        if turn is None or turn.done.is_set():
+            return  # Nothing in flight
+        turn.cancelled = True
+        self._turn_done(turn)
+        if self.answer_task is not None:
+            self.answer_task.cancel()
+        self.ui_manager.stop_speech()
+        print(f"[PIPELINE] Turn {turn.id} cancelled.")
+
+    def _barge_in(self, onset: float) -> None:
+        turn = self.current
+        if turn is None or turn.done.is_set():
+            return
+        self._cancel_current()
+        # From the start of the user's speech until generation was cancelled and playback stopped
+        tracer.record("barge_in_cutoff", time.perf_counter() - onset, turn=turn.id)
+
+    def _turn_done(self, turn: Optional[Turn]) -> None:
+        if turn is not None:
+            if turn.done.is_set():
+                return
+            turn.done.set()
+        if self.on_turn_done is not None:
+            self.on_turn_done(turn)
+
+    # Stages
+
+    async def _stage(self, handle, queue: asyncio.Queue) -> None:
+        """Feed queue items to handle one at a time; an error only loses that item."""
+        name = handle.__name__.strip("_")
+        while True:
+            item = await queue.get()
+            tracer.gauge("queue_depth", queue.qsize(), stage=name)
+            try:
+                await handle(item)
+            except asyncio.CancelledError:
+                if self.stopped.is_set():
+                    raise
+            except Exception as e:
+                print(f"[PIPELINE] {name} error: {e}")
+
+    async def _transcribe(self, item: Tuple[Any, float]) -> None:
+        recording, submitted_at = item
+        with tracer.span("transcription"):
+            result = await self.loop.run_in_executor(None, self.audio_manager.transcribe_recording, recording)
+        if result is None:
+            print("[ERROR] No audio recorded")
+            self._turn_done(None)
+            return
+
+        user_text, detected_lang = result
+        print(f"[You]: {user_text}")
+        # New input replaces whatever is still being answered
+        self._cancel_current()
+
+        turn = Turn(user_text, detected_lang, submitted_at)
+        self.current = turn
+        if user_text.lower() in EXIT_COMMANDS:
+            print("[Assistant]: Goodbye!")
+            turn.voice_lang = "en"
+            await self.segments.put((turn, "Goodbye!"))
+            await self.segments.put((turn, None))
+            await turn.done.wait()
+            self.on_exit()
+            return
+        await self.queries.put(turn)
+
+    async def _answer(self, turn: Turn) -> None:
+        if turn.cancelled:
+            return
+        parts = []
+        # Spans recorded while answering (planning, search, generation) belong to this turn
+        current_turn.set(turn.id)
+        self.answer_task = asyncio.create_task(self._generate(turn, parts))
+        try:
+            await self.answer_task
+        except asyncio.CancelledError:
+            if self.stopped.is_set():
+                raise
+        finally:
+            self.answer_task = None
+
+        response = "".join(parts).strip()
+        print(f"[Assistant]: {response}")
+        if response:
+            # A cancelled answer is kept as far as it got, so follow-ups have context
+            self.llm_interface.update_conversation(turn.query, response)
+        if not turn.cancelled:
+            self.ui_manager.send_notification("Voice Assistant", response)
+
+    async def _generate(self, turn: Turn, parts: list) -> None:
+        """Stream the answer and pass it on sentence by sentence."""
+        segmenter = SentenceSegmenter()
+        try:
+            async for chunk in self.llm_interface.ask_llm_stream(turn.query):
+                parts.append(chunk)
+                for segment in segmenter.feed(chunk):
+                    await self.segments.put((turn, segment))
+            for segment in segmenter.flush():
+                await self.segments.put((turn, segment))
+        finally:
+            if not turn.cancelled:
+                await self.segments.put((turn, None))
+
+    async def _synthesize(self, item: Tuple[Turn, Optional[str]]) -> None:
+        turn, text = item
+        if text is None:
+            await self.audio.put((turn, None))
+            return
+        if turn.cancelled:
+            return
+        if turn.voice_lang is None:
+            # The voice follows the response language, falling back to the language the user spoke
+            turn.voice_lang = await self.loop.run_in_executor(
+                None, self.audio_manager.detect_language, text, turn.lang
+            )
+        with tracer.span("synthesis", turn=turn.id, chars=len(text)):
+            audio_file = await self.loop.run_in_executor(
+                None, self.audio_manager.synthesize_speech, text, turn.voice_lang
+            )
+        if audio_file:
+            await self.audio.put((turn, audio_file))
+
+    async def _play(self, item: Tuple[Turn, Optional[str]]) -> None:
+        turn, audio_file = item
+        if audio_file is None:
+            # End of the turn: wait for its last segment, then hand the speaker back
+            while self.playing and not turn.cancelled:
+                await self.loop.run_in_executor(None, self.playing.popleft().wait)
+            self.playing.clear()
+            if not turn.cancelled:
+                self.ui_manager.is_speaking = False
+                self.ui_manager.current_playback = None
+            self._turn_done(turn)
+            return
+
+        try:
+            if turn.cancelled:
+                return
+            # Keep only a few segments queued on the output so cancellation stays cheap
+            while len(self.playing) >= PIPELINE_PLAYBACK_AHEAD and not turn.cancelled:
+                await self.loop.run_in_executor(None, self.playing.popleft().wait)
+            if turn.cancelled:
+                return
+            self.ui_manager.is_speaking = True
+            handle = self.ui_manager.play_sound(audio_file)
+            if handle is not None:
+                self.playing.append(handle)
+                if not turn.first_audio_recorded:
+                    # From the end of the recording to the first answer audio being queued
+                    turn.first_audio_recorded = True
+                    tracer.record("first_audio", time.perf_counter() - turn.started_at, turn=turn.id)
+        finally:
+            # Decoded into memory when queued, so the file can be released right away
+            self.audio_manager.tts_engine.release(audio_file)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    SEARXNG_URL,
+    SEARCH_TOP_N,
+    PAGE_FETCH_DEADLINE_SECONDS,
+    PAGE_MAX_CHARS,
+    SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_CACHE_MAX_ENTRIES,
+    PAGE_CACHE_TTL_SECONDS,
+    PAGE_CACHE_MAX_CHARS,
+)
+from http_client import get_transport
+from tracing import tracer
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 0, max_size: int = 0):
+        """LRU cache whose entries expire after ttl seconds.
+
+        Memory is bounded by max_entries and/or max_size (sum of len(value));
+        a limit of 0 is ignored. Safe to use from several threads.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sizeof(self, value: Any) -> int:
+        return len(value) if self.max_size else 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.size += self._sizeof(value)
+            while self.entries and (
+                (self.max_entries and len(self.entries) > self.max_entries)
+                or (self.max_size and self.size > self.max_size)
+            ):
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        self.size -= self._sizeof(value)
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text from HTML, one line per block element.
+
+    Scripts, styles and page chrome (navigation, headers, footers, forms)
+    are skipped entirely.
+    """
+    SKIP = {
+        "script", "style", "noscript", "svg", "head", "template",
+        "nav", "header", "footer", "aside", "form", "button", "iframe",
+    }
+    BLOCK = {
+        "p", "div", "br", "li", "tr", "td", "th", "section", "article", "main", "blockquote",
+        "pre", "dd", "dt", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol",
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skip_depth += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    """Extract visible text from an HTML page, one whitespace-normalized line per block."""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        pass  # Keep whatever was parsed before malformed markup
+    lines = (re.sub(r"\s+", " ", line).strip() for line in " ".join(extractor.parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+class Retriever:
+    def __init__(self):
+        """Search and page-fetch stage for internet-backed answers.
+
+        SearXNG responses and extracted page text are cached with TTLs, and
+        the top result pages are fetched concurrently under one deadline.
+        """
+        self.search_cache = TTLCache(SEARCH_CACHE_TTL_SECONDS, max_entries=SEARCH_CACHE_MAX_ENTRIES)
+        self.page_cache = TTLCache(PAGE_CACHE_TTL_SECONDS, max_size=PAGE_CACHE_MAX_CHARS)
+
+    async def search(self, search_query: str) -> Dict[str, Any]:
+        """Return SearXNG JSON results for a query ({} if nothing usable came back)."""
+        key = search_query.strip().lower()
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            print(f"[SEARCH] Cache hit for: {search_query}")
+            return cached
+
+        with tracer.span("search"):
+            response = await get_transport().get("searxng", SEARXNG_URL, params={"q": search_query, "format": "json"})
+        if response.status_code != 200:
+            print(f"[SEARCH] Error: HTTP {response.status_code}")
+            return {}
+
+        raw_text = response.text.strip()
+        if raw_text in ['"query"', 'query']:
+            return {}
+        try:
+            results = json.loads(raw_text)
+        except Exception:
+            return {}
+        if not isinstance(results, dict):
+            return {}
+
+        self.search_cache.put(key, results)
+        return results
+
+    async def _fetch_page(self, url: str) -> Optional[str]:
+        """Fetch one page and return its extracted text."""
+        cached = self.page_cache.get(url)
+        if cached is not None:
+            return cached
+
+        response = await get_transport().get("web", url)
+        if response.status_code != 200 or "html" not in response.headers.get("content-type", "html"):
+            return None
+        text = html_to_text(response.text)[:PAGE_MAX_CHARS]
+        if text:
+            self.page_cache.put(url, text)
+        return text or None
+
+    async def fetch_pages(self, urls: List[str]) -> List[Tuple[str, str]]:
+        """Fetch pages concurrently and return (url, text) for those ready before the deadline, in rank order."""
+        if not urls:
+            return []
+        tasks = [asyncio.ensure_future(self._fetch_page(url)) for url in urls]
+        with tracer.span("page_fetch", pages=len(urls)) as span:
+            done, pending = await asyncio.wait(tasks, timeout=PAGE_FETCH_DEADLINE_SECONDS)
+            span["late"] = len(pending)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"[SEARCH] {len(pending)} of {len(tasks)} pages missed the {PAGE_FETCH_DEADLINE_SECONDS}s deadline")
+
+        pages = []
+        for url, task in zip(urls, tasks):
+            if task in done and not task.cancelled() and task.exception() is None and task.result():
+                pages.append((url, task.result()))
+        return pages
+
+    @staticmethod
+    def snippets(results: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """Return (url, snippet) for search results that carry a text snippet."""
+        return [
+            (result.get("url", ""), result["content"])
+            for result in results.get("results") or []
+            if isinstance(result, dict) and isinstance(result.get("content"), str) and result["content"].strip()
+        ]
+
+    @staticmethod
+    def top_urls(results: Dict[str, Any], count: int = SEARCH_TOP_N) -> List[str]:
+        """Return the URLs of the top search results."""
+        urls = []
+        for result in results.get("results") or []:
+            if isinstance(result, dict) and result.get("url") and result["url"] not in urls:
+                urls.append(result["url"])
+            if len(urls) >= count:
+                break
+        return urls
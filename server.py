@@ -0,0 +1,218 @@
+"""Headless multi-session server.
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8765]
+
+Clients connect over WebSocket (ws://host:port/?session=<id>) and stream
+16-bit mono PCM at SAMPLE_RATE as binary messages. A session id can be
+used by one connection at a time; a second one is closed with code 1008. Control messages are
+JSON text:
+    {"type": "start"}        start a recording (also implied by the first audio chunk)
+    {"type": "end"}          end the recording and answer it (or let VAD end it)
+    {"type": "stop_speech"}  cancel the answer in progress
+
+The server replies with JSON text messages ({"type": "response", "text": ...},
+{"type": "turn_done", "query": ...}) and, for each spoken segment, an
+{"type": "audio", "format": "mp3"} message followed by the encoded audio
+as a binary message.
+
+All sessions share one speech-to-text model, one TTS engine and the pooled
+Ollama client; each session has its own conversation history and memory.
+Utterances that finish at about the same time in different sessions are
+transcribed together in one batch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_MAX_SESSIONS, SERVER_CPUS_PER_SESSION, SERVER_SESSIONS_DIR,
+)
+from stt_backends import BackgroundLoadedBackend
+from stt_scheduler import BatchingSTT
+from tts_engine import TTSEngine
+from audio_manager import AudioManager
+from audio_output import PlaybackHandle
+from conversation_manager import ConversationManager
+from llm_interface import LLMInterface
+from pipeline import VoicePipeline
+from model_residency import ModelResidency
+from tracing import tracer
+
+def max_sessions() -> int:
+    """Session limit from config, or one session per SERVER_CPUS_PER_SESSION cores."""
+    if SERVER_MAX_SESSIONS:
+        return SERVER_MAX_SESSIONS
+    return max(1, (os.cpu_count() or 1) // SERVER_CPUS_PER_SESSION)
+
+class SessionUI:
+    """UIManager stand-in that sends speech and responses to the session's client."""
+
+    def __init__(self, session: "Session"):
+        self.session = session
+        self.is_speaking = False
+        self.current_playback = None
+
+    def play_sound(self, sound_file: str) -> Optional[PlaybackHandle]:
+        """Send an audio file to the client; it is done as soon as it is queued for sending."""
+        with open(sound_file, "rb") as f:
+            audio = f.read()
+        self.session.send({"type": "audio", "format": os.path.splitext(sound_file)[1].lstrip(".")})
+        self.session.send(audio)
+        handle = PlaybackHandle(np.zeros(0, dtype=np.float32))
+        handle.done.set()
+        return handle
+
+    def stop_speech(self) -> None:
+        self.is_speaking = False
+        self.session.send({"type": "stop_speech"})
+
+    def send_notification(self, title: str, message: str) -> None:
+        self.session.send({"type": "response", "text": message})
+
+class Session:
+    def __init__(self, server: "AssistantServer", websocket, session_id: str):
+        """One client connection with its own recording, history and turn pipeline."""
+        self.websocket = websocket
+        self.id = session_id
+        self.loop = asyncio.get_running_loop()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        directory = os.path.join(SERVER_SESSIONS_DIR, session_id)
+        os.makedirs(directory, exist_ok=True)
+
+        self.ui = SessionUI(self)
+        # Whole utterances are transcribed after they end: streaming windows need word timestamps
+        # and a per-session prompt, so they could not share a batch with other sessions
+        self.audio_manager = AudioManager(
+            self.ui, capture=False, stt=server.stt, tts_engine=server.tts_engine, streaming=False
+        )
+        self.audio_manager.on_endpoint = self.end_recording
+        self.conversation_manager = ConversationManager(
+            log_file=os.path.join(directory, "history.jsonl"),
+            legacy_file=None,
+            memory_dir=os.path.join(directory, "memory")
+        )
+        self.llm_interface = LLMInterface(self.conversation_manager)
+        self.pipeline = VoicePipeline(
+            self.audio_manager, self.llm_interface, self.ui,
+            on_exit=lambda: self.loop.create_task(self.websocket.close()),
+            on_turn_done=lambda turn: self.send({"type": "turn_done", "query": turn.query if turn else None})
+        )
+
+    def send(self, message) -> None:
+        """Queue a JSON-serializable message or binary audio for the client (any thread)."""
+        data = message if isinstance(message, bytes) else json.dumps(message)
+        self.loop.call_soon_threadsafe(self.outgoing.put_nowait, data)
+
+    async def _sender(self) -> None:
+        while True:
+            await self.websocket.send(await self.outgoing.get())
+
+    def end_recording(self) -> None:
+        recording = self.audio_manager.stop_recording()
+        if recording is not None:
+            self.pipeline.submit_recording(recording)
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self.pipeline.run()), asyncio.create_task(self._sender())]
+        await asyncio.sleep(0)  # Let the pipeline create its queues before the first message
+        try:
+            async for message in self.websocket:
+                if isinstance(message, bytes):
+                    if len(message) % 2:
+                        self.send({"type": "error", "error": "audio must be 16-bit PCM, got an odd number of bytes"})
+                        continue
+                    if not self.audio_manager.recording:
+                        self.audio_manager.start_recording()
+                    self.audio_manager.handle_audio_chunk(np.frombuffer(message, dtype=np.int16))
+                    continue
+                try:
+                    command = json.loads(message).get("type")
+                except (ValueError, AttributeError):
+                    self.send({"type": "error", "error": "control messages must be JSON objects"})
+                    continue
+                if command == "start":
+                    self.audio_manager.start_recording()
+                elif command == "end":
+                    self.end_recording()
+                elif command == "stop_speech":
+                    self.pipeline.stop_speech()
+        finally:
+            self.pipeline.stop()
+            self.audio_manager.stop_recording()
+            self.conversation_manager.close()
+            for task in tasks:
+                task.cancel()
+
+class AssistantServer:
+    def __init__(self):
+        """Loads the shared models once and admits sessions up to the CPU budget."""
+        self.stt = BatchingSTT(BackgroundLoadedBackend())
+        self.tts_engine = TTSEngine()
+        self.limit = max_sessions()
+        self.sessions = 0
+        self.active_ids = set()  # Two connections must never share a session's history and memory files
+        # The Ollama models are loaded once for all sessions and kept loaded
+        self.residency = ModelResidency(self.stt)
+        self.residency.start()
+
+    async def handle(self, websocket, path: Optional[str] = None) -> None:
+        # websockets >= 13 passes only the connection; older versions also pass the path
+        if path is None:
+            request = getattr(websocket, "request", None)
+            path = request.path if request is not None else getattr(websocket, "path", "/")
+        if self.sessions >= self.limit:
+            await websocket.send(json.dumps({"type": "error", "error": "server busy, try again later"}))
+            await websocket.close(code=1013, reason="server busy")
+            print(f"[SERVER] Rejected a session, {self.sessions}/{self.limit} in use")
+            return
+
+        requested = parse_qs(urlparse(path).query).get("session", [""])[0]
+        session_id = requested if re.fullmatch(r"[\w-]{1,64}", requested) else uuid.uuid4().hex
+        if session_id in self.active_ids:
+            await websocket.send(json.dumps({"type": "error", "error": f"session {session_id} is already connected"}))
+            await websocket.close(code=1008, reason="session already connected")
+            print(f"[SERVER] Rejected a second connection to session {session_id}")
+            return
+        self.active_ids.add(session_id)
+        self.sessions += 1
+        tracer.gauge("sessions", self.sessions)
+        print(f"[SERVER] Session {session_id} connected ({self.sessions}/{self.limit})")
+        try:
+            await Session(self, websocket, session_id).run()
+        except Exception as e:
+            print(f"[SERVER] Session {session_id} ended with an error: {e}")
+        finally:
+            self.active_ids.discard(session_id)
+            self.sessions -= 1
+            tracer.gauge("sessions", self.sessions)
+            print(f"[SERVER] Session {session_id} disconnected")
+
+async def serve(host: str, port: int) -> None:
+    import websockets
+
+    server = AssistantServer()
+    tracer.serve_metrics()
+    async with websockets.serve(server.handle, host, port, max_size=2 ** 20):
+        print(f"[SERVER] Listening on ws://{host}:{port} (up to {server.limit} sessions)")
+        await asyncio.Future()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the voice assistant to several clients over WebSocket.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n[SERVER] Stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+class StartupTimer:
+    def __init__(self):
+        """Record how long each startup phase takes, including background warm-up."""
+        self.start_time = time.perf_counter()
+        self.phases: List[Tuple[str, float, bool]] = []  # (name, seconds, background)
+        self.pending: Dict[str, float] = {}
+        self.ready_time = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a blocking startup phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, time.perf_counter() - start, False))
+
+    @contextmanager
+    def background(self, name: str) -> Iterator[None]:
+        """Time a phase running on a background thread; reports once the last one finishes."""
+        start = time.perf_counter()
+        with self.lock:
+            self.pending[name] = start
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.pending.pop(name, None)
+                self.phases.append((name, time.perf_counter() - start, True))
+                finished = not self.pending and self.ready_time is not None
+            if finished:
+                self.report()
+
+    def mark_ready(self) -> None:
+        """Mark the point where the assistant accepts input and print the report so far."""
+        self.ready_time = time.perf_counter() - self.start_time
+        self.report()
+
+    def report(self) -> None:
+        """Print the startup breakdown."""
+        with self.lock:
+            phases = list(self.phases)
+            pending = list(self.pending)
+
+        print("[STARTUP] Time breakdown:")
+        for name, seconds, background in phases:
+            print(f"[STARTUP]   {name:<24}{seconds:>7.2f}s{'  (background)' if background else ''}")
+        if self.ready_time is not None:
+            print(f"[STARTUP]   {'ready for input':<24}{self.ready_time:>7.2f}s")
+        if pending:
+            print(f"[STARTUP]   still loading: {', '.join(pending)}")
+
+# Shared by all modules so one report covers the whole startup
+startup_timer = StartupTimer()
@@ -0,0 +1,143 @@
+import threading
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+
+from stt_backends import STTBackend
+
+from config import (
+    SAMPLE_RATE,
+    STREAM_STEP_SECONDS,
+    STREAM_MIN_WINDOW_SECONDS,
+    STREAM_MAX_WINDOW_SECONDS,
+)
+
+# A hypothesis word: (absolute start sample, absolute end sample, text)
+Word = Tuple[int, int, str]
+
+class StreamingTranscriber:
+    def __init__(self, stt: STTBackend,
+                 get_audio: Callable[[int, Optional[int]], np.ndarray],
+                 get_speech_bounds: Callable[[], Optional[Tuple[int, int]]]):
+        """Incrementally transcribe a recording while it is still being captured.
+
+        Overlapping windows starting at the last committed word are decoded
+        every STREAM_STEP_SECONDS. Words that two consecutive decodes agree on
+        are committed and the window start moves past them, so when recording
+        stops only the short uncommitted tail has to be decoded. Windows are
+        clipped to the speech bounds reported by voice activity detection.
+        """
+        self.stt = stt
+        self.get_audio = get_audio
+        self.get_speech_bounds = get_speech_bounds
+
+        self.committed_words: List[str] = []
+        self.committed_offset = 0  # Sample index where the next window starts
+        self.pending: List[Word] = []  # Uncommitted words of the previous decode
+        self.language: Optional[str] = None
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start decoding windows in the background."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Decode a new window every step until stopped."""
+        while not self._stop_event.wait(STREAM_STEP_SECONDS):
+            try:
+                self._process_window()
+            except Exception as e:
+                print(f"[STREAM] Decode error: {e}")
+
+    def _decode(self, window: np.ndarray, offset: int) -> List[Word]:
+        """Decode a window and return its words with absolute sample positions."""
+        prompt = "".join(self.committed_words[-30:]) or None
+        result = self.stt.transcribe(
+            window,
+            language=self.language,
+            initial_prompt=prompt,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            temperature=0.0,
+        )
+        if self.language is None:
+            self.language = result.get("language", "en")
+
+        words: List[Word] = []
+        for segment in result.get("segments", []):
+            for w in segment.get("words", []):
+                start = offset + int(w["start"] * SAMPLE_RATE)
+                end = offset + int(w["end"] * SAMPLE_RATE)
+                words.append((start, end, w["word"]))
+        return words
+
+    @staticmethod
+    def _normalize(word: str) -> str:
+        """Normalize a word for agreement comparison."""
+        return word.strip().lower().strip(".,!?;:\"'")
+
+    def _commit(self, words: List[Word]) -> None:
+        """Commit words and move the window start past them."""
+        if not words:
+            return
+        self.committed_words.extend(w[2] for w in words)
+        self.committed_offset = max(self.committed_offset, words[-1][1])
+
+    def _process_window(self) -> None:
+        """Decode the uncommitted audio and commit the stable prefix."""
+        bounds = self.get_speech_bounds()
+        if bounds is None:
+            return  # Nothing but silence so far
+        offset = max(self.committed_offset, bounds[0])
+        window = self.get_audio(offset, bounds[1])
+        if len(window) < STREAM_MIN_WINDOW_SECONDS * SAMPLE_RATE:
+            return
+
+        words = self._decode(window, offset)
+
+        # Local agreement: commit the longest prefix shared with the last decode
+        agreed = 0
+        for prev, cur in zip(self.pending, words):
+            if self._normalize(prev[2]) != self._normalize(cur[2]):
+                break
+            agreed += 1
+
+        # Keep the window bounded if the decodes never settle
+        if agreed == 0 and len(window) > STREAM_MAX_WINDOW_SECONDS * SAMPLE_RATE:
+            horizon = offset + len(window) - int(STREAM_MIN_WINDOW_SECONDS * SAMPLE_RATE)
+            while agreed < len(words) and words[agreed][1] <= horizon:
+                agreed += 1
+
+        self._commit(words[:agreed])
+        self.pending = words[agreed:]
+
+    def detach(self, get_audio: Callable[[int, Optional[int]], np.ndarray],
+               get_speech_bounds: Callable[[], Optional[Tuple[int, int]]]) -> None:
+        """Stop decoding new windows and read the recording from the given sources from now on.
+
+        Called when recording stops, so the tail decode in finish() sees the
+        finished recording even if a new one has started in the meantime.
+        """
+        self._stop_event.set()
+        self.get_audio = get_audio
+        self.get_speech_bounds = get_speech_bounds
+
+    def finish(self) -> Tuple[str, str]:
+        """Stop background decoding, decode the remaining tail and return the transcript."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        try:
+            bounds = self.get_speech_bounds()
+            if bounds is not None:
+                offset = max(self.committed_offset, bounds[0])
+                tail = self.get_audio(offset, bounds[1])
+                if len(tail) > 0:
+                    self._commit(self._decode(tail, offset))
+        except Exception as e:
+            print(f"[STREAM] Tail decode error: {e}")
+
+        return "".join(self.committed_words).strip(), self.language or "en"
@@ -0,0 +1,259 @@
+import os
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Union
+
+from config import (
+    SAMPLE_RATE, STT_BACKEND, STT_MODEL, STT_DEVICE, STT_COMPUTE_TYPE, STT_THREADS,
+    STT_MMAP_WEIGHTS, STT_WEIGHTS_DIR,
+)
+from startup_timer import startup_timer
+
+class STTBackend:
+    """Common interface for speech-to-text engines.
+
+    transcribe() returns a Whisper-style result dict with "text", "language"
+    and "segments" (each with a "words" list of {"start", "end", "word"}
+    when word_timestamps is requested), so callers do not care which
+    engine is loaded. Extra keyword options such as temperature and
+    condition_on_previous_text are passed through to the engine.
+    """
+    name = "base"
+
+    def transcribe(self, audio: Union[str, np.ndarray], language: Optional[str] = None,
+                   initial_prompt: Optional[str] = None, word_timestamps: bool = False,
+                   **options: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios: List[np.ndarray], language: Optional[str] = None,
+                         initial_prompt: Optional[str] = None, **options: Any) -> List[Dict[str, Any]]:
+        """Transcribe several clips of at most 30 seconds with the same options.
+
+        Engines that can decode a batch in one pass override this; the
+        default decodes the clips one after another.
+        """
+        return [self.transcribe(audio, language=language, initial_prompt=initial_prompt, **options)
+                for audio in audios]
+
+    def wait_until_loaded(self) -> "STTBackend":
+        """Block until the model is ready; engines loaded in the constructor already are."""
+        return self
+
+    def resident_mb(self) -> Optional[float]:
+        """Memory held by the model weights in MB, or None if the engine cannot tell."""
+        return None
+
+class WhisperBackend(STTBackend):
+    """openai-whisper running in fp32 via PyTorch."""
+    name = "whisper"
+
+    def __init__(self, model_name: str = STT_MODEL, device: str = STT_DEVICE, threads: int = STT_THREADS,
+                 mmap_weights: bool = STT_MMAP_WEIGHTS):
+        import torch
+        import whisper
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.weights_file: Optional[str] = None
+        if mmap_weights and device == "cpu":
+            try:
+                self.model, self.weights_file = self._load_mapped(model_name)
+            except Exception as e:
+                # Needs torch >= 2.1 for mmap loading
+                print(f"[AUDIO] Could not memory-map Whisper weights ({e}), loading a private copy")
+        if self.weights_file is None:
+            self.model = whisper.load_model(model_name, device=device)
+        self.fp16 = device != "cpu"
+
+    @staticmethod
+    def _load_mapped(model_name: str, weights_dir: str = STT_WEIGHTS_DIR):
+        """Load the model with its weights memory-mapped from an fp32 copy of the checkpoint.
+
+        The published checkpoints are fp16 and have to be converted for CPU
+        inference, which gives every process its own copy. The converted
+        weights are saved once; mapping that file keeps them in the page
+        cache, shared by all processes that load the same model.
+        """
+        import torch
+        import whisper
+
+        directory = os.path.expanduser(weights_dir)
+        path = os.path.join(directory, f"{model_name}-fp32.pt")
+        if not os.path.exists(path):
+            print(f"[AUDIO] Converting Whisper {model_name} weights for memory mapping...")
+            model = whisper.load_model(model_name, device="cpu", download_root=directory)
+            temp_path = path + ".tmp"
+            torch.save({"dims": vars(model.dims), "model_state_dict": model.state_dict()}, temp_path)
+            os.replace(temp_path, path)
+            del model
+
+        checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        model = whisper.model.Whisper(whisper.model.ModelDimensions(**checkpoint["dims"]))
+        # assign=True keeps the mapped tensors instead of copying them into the new parameters
+        model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+        if model_name in whisper._ALIGNMENT_HEADS:
+            model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+        return model, path
+
+    def resident_mb(self):
+        if self.weights_file is not None:
+            try:
+                import psutil
+
+                # Only the pages of the mapped file that are actually in memory
+                path = os.path.realpath(self.weights_file)
+                return sum(m.rss for m in psutil.Process().memory_maps() if m.path == path) / (1024 * 1024)
+            except Exception:
+                pass
+        return sum(p.numel() * p.element_size() for p in self.model.parameters()) / (1024 * 1024)
+
+    def transcribe(self, audio, language=None, initial_prompt=None, word_timestamps=False, **options):
+        return self.model.transcribe(
+            audio,
+            language=language,
+            initial_prompt=initial_prompt,
+            word_timestamps=word_timestamps,
+            fp16=self.fp16,
+            **options
+        )
+
+    def transcribe_batch(self, audios, language=None, initial_prompt=None, **options):
+        """Run the encoder and decoder once over all clips stacked into one mel batch.
+
+        Unlike transcribe() there is no temperature fallback, so each clip
+        gets a single greedy decode.
+        """
+        import torch
+        import whisper
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        temperature = options.get("temperature", 0.0)
+        if isinstance(temperature, (list, tuple)):
+            temperature = temperature[0]
+        decoded = whisper.decode(self.model, mels, whisper.DecodingOptions(
+            language=language, prompt=initial_prompt, temperature=temperature,
+            without_timestamps=True, fp16=self.fp16
+        ))
+
+        results = []
+        for audio, result in zip(audios, decoded):
+            # Same silence test as whisper.transcribe's default thresholds
+            silent = result.no_speech_prob > 0.6 and result.avg_logprob < -1.0
+            text = "" if silent else result.text
+            segments = [{"start": 0.0, "end": len(audio) / SAMPLE_RATE, "text": text, "words": []}] if text else []
+            results.append({"text": text, "language": result.language, "segments": segments})
+        return results
+
+class FasterWhisperBackend(STTBackend):
+    """CTranslate2 Whisper (faster-whisper) with quantized weights, int8 by default."""
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str = STT_MODEL, device: str = STT_DEVICE,
+                 compute_type: str = STT_COMPUTE_TYPE, threads: int = STT_THREADS):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=threads)
+
+    def transcribe(self, audio, language=None, initial_prompt=None, word_timestamps=False, **options):
+        segments, info = self.model.transcribe(
+            audio,
+            language=language,
+            initial_prompt=initial_prompt,
+            word_timestamps=word_timestamps,
+            beam_size=options.pop("beam_size", 1),
+            **options
+        )
+
+        # Segments are generated lazily; decoding happens while we iterate
+        result_segments = []
+        for segment in segments:
+            words = [
+                {"start": w.start, "end": w.end, "word": w.word}
+                for w in (segment.words or [])
+            ]
+            result_segments.append({"start": segment.start, "end": segment.end,
+                                    "text": segment.text, "words": words})
+
+        return {
+            "text": "".join(s["text"] for s in result_segments),
+            "language": info.language,
+            "segments": result_segments,
+        }
+
+# CUSTOMIZE: Register additional speech-to-text backends here
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+def create_stt_backend(name: str = STT_BACKEND, **kwargs: Any) -> STTBackend:
+    """Load a speech-to-text backend; kwargs override the config.py model settings."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown STT backend '{name}'. Options: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+class BackgroundLoadedBackend(STTBackend):
+    """Loads a backend on a background thread so startup does not wait for model weights.
+
+    transcribe() blocks until loading has finished; audio can be captured
+    in the meantime.
+    """
+
+    def __init__(self, name: str = STT_BACKEND, **kwargs: Any):
+        self.name = name
+        self.backend: Optional[STTBackend] = None
+        self.error: Optional[Exception] = None
+        self.load_rss_mb: Optional[float] = None  # Process memory growth while loading
+        self.ready = threading.Event()
+        threading.Thread(target=self._load, args=(kwargs,), daemon=True).start()
+
+    def _load(self, kwargs: Dict[str, Any]) -> None:
+        with startup_timer.background(f"{self.name} model load"):
+            try:
+                rss_before = _process_rss_mb()
+                self.backend = create_stt_backend(self.name, **kwargs)
+                if rss_before is not None:
+                    self.load_rss_mb = _process_rss_mb() - rss_before
+                print(f"[AUDIO] Speech-to-text model loaded ({self.name}).")
+            except Exception as e:
+                self.error = e
+                print(f"[AUDIO] Error loading speech-to-text model: {e}")
+            finally:
+                self.ready.set()
+
+    def wait_until_loaded(self) -> STTBackend:
+        """Block until the model is loaded and return it."""
+        if not self.ready.is_set():
+            print("[AUDIO] Waiting for speech-to-text model to finish loading...")
+            self.ready.wait()
+        if self.backend is None:
+            raise RuntimeError(f"Speech-to-text model failed to load: {self.error}")
+        return self.backend
+
+    def transcribe(self, audio, language=None, initial_prompt=None, word_timestamps=False, **options):
+        return self.wait_until_loaded().transcribe(
+            audio, language=language, initial_prompt=initial_prompt,
+            word_timestamps=word_timestamps, **options
+        )
+
+    def transcribe_batch(self, audios, language=None, initial_prompt=None, **options):
+        return self.wait_until_loaded().transcribe_batch(
+            audios, language=language, initial_prompt=initial_prompt, **options
+        )
+
+    def resident_mb(self):
+        if self.backend is None:
+            return None
+        # Engines that cannot measure their weights are estimated from the growth during loading
+        resident = self.backend.resident_mb()
+        return resident if resident is not None else self.load_rss_mb
+
+def _process_rss_mb() -> Optional[float]:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
@@ -0,0 +1,168 @@
+"""Speech-to-text backend benchmark.
+
+Usage:
+    python stt_benchmark.py fixture1.wav fixture2.wav [--backends whisper faster-whisper] [--concurrent]
+
+Each backend runs in a fresh subprocess so its peak RSS is measured in
+isolation. Reports load time, real-time factor (decode time / audio
+duration, lower is better) and peak resident memory.
+
+With --concurrent all fixtures are submitted at once through the batching
+scheduler, as utterances from several server sessions would be. The RTF is
+then wall time / total audio, and the mean batch size and queue wait are
+reported so STT_BATCH_WINDOW_MS can be tuned.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+import wave
+import numpy as np
+from typing import Dict, List
+
+from config import SAMPLE_RATE
+
+def load_wav(path: str) -> np.ndarray:
+    """Load a 16-bit PCM WAV file as mono float32 at SAMPLE_RATE."""
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        rate = wf.getframerate()
+        channels = wf.getnchannels()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+
+    audio = samples.reshape(-1, channels).mean(axis=1).astype(np.float32) / 32768.0
+    if rate != SAMPLE_RATE:
+        # Linear resampling is good enough for benchmarking purposes
+        duration = len(audio) / rate
+        target = np.linspace(0, duration, int(duration * SAMPLE_RATE), endpoint=False)
+        audio = np.interp(target, np.arange(len(audio)) / rate, audio).astype(np.float32)
+    return audio
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+def run_concurrent(backend, audios: List[np.ndarray]) -> Dict:
+    """Transcribe all clips at once through the batching scheduler."""
+    from stt_scheduler import BatchingSTT
+    from tracing import tracer
+
+    scheduler = BatchingSTT(backend)
+    results: List[Dict] = [{}] * len(audios)
+
+    def worker(i: int) -> None:
+        results[i] = scheduler.transcribe(audios[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(audios))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def mean(name: str) -> float:
+        histogram = tracer.histograms.get(name)
+        return histogram["sum"] / histogram["counts"][-1] if histogram else 0.0
+
+    return {
+        "elapsed": elapsed,
+        "results": results,
+        "mean_batch_size": mean("stt_batch_size"),
+        "mean_queue_wait_ms": mean("stt_queue_wait_seconds") * 1000,
+    }
+
+def run_backend(name: str, files: List[str], concurrent: bool = False) -> Dict:
+    """Load one backend and transcribe every fixture (runs inside the worker process)."""
+    from stt_backends import create_stt_backend
+
+    start = time.perf_counter()
+    backend = create_stt_backend(name)
+    load_seconds = time.perf_counter() - start
+
+    if concurrent:
+        audios = [load_wav(path) for path in files]
+        report = run_concurrent(backend, audios)
+        audio_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+        return {
+            "backend": name,
+            "load_seconds": load_seconds,
+            "rtf": report["elapsed"] / audio_seconds if audio_seconds else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "mean_batch_size": report["mean_batch_size"],
+            "mean_queue_wait_ms": report["mean_queue_wait_ms"],
+            "files": [{"file": path, "rtf": 0.0, "text": result.get("text", "").strip()}
+                      for path, result in zip(files, report["results"])],
+        }
+
+    audio_seconds = 0.0
+    decode_seconds = 0.0
+    per_file = []
+    for path in files:
+        audio = load_wav(path)
+        start = time.perf_counter()
+        result = backend.transcribe(audio)
+        elapsed = time.perf_counter() - start
+        duration = len(audio) / SAMPLE_RATE
+
+        audio_seconds += duration
+        decode_seconds += elapsed
+        per_file.append({
+            "file": path,
+            "rtf": elapsed / duration if duration else 0.0,
+            "text": result.get("text", "").strip(),
+        })
+
+    return {
+        "backend": name,
+        "load_seconds": load_seconds,
+        "rtf": decode_seconds / audio_seconds if audio_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "files": per_file,
+    }
+
+def main() -> None:
+    from stt_backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text backends on WAV fixtures.")
+    parser.add_argument("files", nargs="+", help="16-bit PCM WAV fixtures")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--concurrent", action="store_true", help="Submit all fixtures at once through the batching scheduler")
+    parser.add_argument("--verbose", action="store_true", help="Show per-file results")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.files, args.concurrent)))
+        return
+
+    print(f"{'backend':<16}{'load (s)':>10}{'RTF':>8}{'peak RSS (MB)':>16}")
+    for name in args.backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", name, *args.files] + (["--concurrent"] if args.concurrent else []),
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{name:<16}failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+
+        report = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{name:<16}{report['load_seconds']:>10.2f}{report['rtf']:>8.3f}{report['peak_rss_mb']:>16.0f}")
+        if args.concurrent:
+            print(f"    mean batch size {report['mean_batch_size']:.1f}, mean queue wait {report['mean_queue_wait_ms']:.0f} ms")
+        if args.verbose:
+            for item in report["files"]:
+                print(f"    {item['rtf']:.3f}  {item['file']}: {item['text']}")
+
+if __name__ == "__main__":
+    main()
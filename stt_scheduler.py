@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import SAMPLE_RATE, STT_BATCH_WINDOW_MS, STT_BATCH_MAX
+from stt_backends import STTBackend
+from tracing import tracer
+
+# Whisper decodes 30-second windows; longer clips cannot share a batch
+MAX_BATCH_SAMPLES = 30 * SAMPLE_RATE
+# transcribe() options that transcribe_batch() can honour
+BATCH_OPTIONS = {"language", "initial_prompt", "word_timestamps", "temperature", "condition_on_previous_text"}
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+QUEUE_WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class _Request:
+    def __init__(self, audio, options: Dict[str, Any]):
+        self.audio = audio
+        self.options = options
+        self.queued_at = time.perf_counter()
+        self.future: Future = Future()
+
+class BatchingSTT(STTBackend):
+    def __init__(self, backend: STTBackend, window_ms: float = STT_BATCH_WINDOW_MS, max_batch: int = STT_BATCH_MAX):
+        """Queues transcriptions from many threads and decodes them in micro-batches.
+
+        A worker thread takes the first pending utterance, waits up to
+        window_ms for more and decodes those with matching options through
+        the backend's transcribe_batch() as one batch. Each caller blocks on
+        its own future. Clips longer than 30 seconds or requests for word
+        timestamps (streaming windows) are decoded on their own, in order,
+        which is why server sessions do not use streaming transcription.
+        Batch sizes and queue waits are recorded as histograms.
+        """
+        self.backend = backend
+        self.name = backend.name
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests: "queue.Queue[_Request]" = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def transcribe(self, audio, language=None, initial_prompt=None, word_timestamps=False, **options):
+        request = _Request(audio, dict(language=language, initial_prompt=initial_prompt,
+                                       word_timestamps=word_timestamps, **options))
+        self.requests.put(request)
+        return request.future.result()
+
+    def wait_until_loaded(self) -> STTBackend:
+        return self.backend.wait_until_loaded()
+
+    def resident_mb(self):
+        return self.backend.resident_mb()
+
+    def _collect(self) -> List[_Request]:
+        """Block for one request, then gather whatever else arrives within the window."""
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _batch_key(request: _Request) -> Optional[tuple]:
+        """Requests with equal keys can be decoded together; None means decode alone."""
+        options = request.options
+        if (not isinstance(request.audio, np.ndarray) or len(request.audio) > MAX_BATCH_SAMPLES
+                or options["word_timestamps"] or set(options) - BATCH_OPTIONS):
+            return None
+        return tuple(sorted((key, repr(value)) for key, value in options.items()))
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for request in batch:
+                tracer.observe("stt_queue_wait_seconds", started - request.queued_at, QUEUE_WAIT_BUCKETS)
+
+            groups: Dict[Optional[tuple], List[_Request]] = {}
+            alone = []
+            for request in batch:
+                key = self._batch_key(request)
+                if key is None:
+                    alone.append([request])
+                else:
+                    groups.setdefault(key, []).append(request)
+            for group in list(groups.values()) + alone:
+                self._decode(group)
+
+    def _decode(self, group: List[_Request]) -> None:
+        tracer.observe("stt_batch_size", len(group), BATCH_SIZE_BUCKETS)
+        try:
+            if len(group) == 1:
+                # A lone clip keeps transcribe()'s full decoding (temperature fallback, timestamps)
+                results = [self.backend.transcribe(group[0].audio, **group[0].options)]
+            else:
+                options = dict(group[0].options)
+                del options["word_timestamps"]
+                results = self.backend.transcribe_batch([request.audio for request in group], **options)
+        except Exception as e:
+            for request in group:
+                request.future.set_exception(e)
+            return
+        for request, result in zip(group, results):
+            request.future.set_result(result)
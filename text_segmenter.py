@@ -0,0 +1,67 @@
+import re
+from typing import List
+
+from config import TTS_MIN_SEGMENT_CHARS, TTS_CLAUSE_SPLIT_CHARS
+
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx", "no"}
+
+SENTENCE_END = re.compile(r'[.!?。！？]+["\')\]]*(?=\s)|\n+')
+CLAUSE_END = re.compile(r'[,;:、，]\s')
+
+class SentenceSegmenter:
+    def __init__(self, min_chars: int = TTS_MIN_SEGMENT_CHARS, clause_chars: int = TTS_CLAUSE_SPLIT_CHARS):
+        """Split streamed LLM text into speakable segments as soon as they are complete.
+
+        Segments end at sentence boundaries. A long run without one is split
+        at the last clause boundary (comma, semicolon, colon) so speech can
+        start before the sentence finishes. Segments shorter than min_chars
+        are merged with the next one to avoid choppy synthesis.
+        """
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.buffer = ""
+
+    def _is_abbreviation(self, text: str, end: int) -> bool:
+        """Check whether the period at text[end - 1] belongs to an abbreviation or initial."""
+        if text[end - 1] != ".":
+            return False
+        words = text[:end - 1].split()
+        if not words:
+            return False
+        word = words[-1].lower().lstrip("(\"'")
+        return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add streamed text and return any segments that are now complete."""
+        self.buffer += chunk
+        segments = []
+        search_from = 0
+
+        while True:
+            match = SENTENCE_END.search(self.buffer, search_from)
+            if match is None:
+                break
+            end = match.end()
+            if self._is_abbreviation(self.buffer, end) or len(self.buffer[:end].strip()) < self.min_chars:
+                search_from = end
+                continue
+            segments.append(self.buffer[:end].strip())
+            self.buffer = self.buffer[end:]
+            search_from = 0
+
+        # Split long sentences at the last clause boundary
+        if len(self.buffer) >= self.clause_chars:
+            clauses = list(CLAUSE_END.finditer(self.buffer))
+            if clauses and clauses[-1].end() >= self.min_chars:
+                end = clauses[-1].end()
+                segments.append(self.buffer[:end].strip())
+                self.buffer = self.buffer[end:]
+
+        return [s for s in segments if s]
+
+    def flush(self) -> List[str]:
+        """Return whatever text is left once the stream has ended."""
+        remaining = self.buffer.strip()
+        self.buffer = ""
+        return [remaining] if remaining else []
@@ -0,0 +1,200 @@
+"""Per-stage latency tracing and metrics.
+
+Every stage of a turn records a timed span. Spans, gauges (queue
+depths, dropped input frames) and histogram observations (STT batch
+sizes and queue waits) go to a rotating JSONL trace file and, if
+METRICS_PORT is set, are served in Prometheus text format at /metrics
+by the running assistant.
+
+Summarize a trace file with:
+    python tracing.py [traces/trace.jsonl]
+"""
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import TRACE_ENABLED, TRACE_FILE, TRACE_MAX_MB, TRACE_BACKUPS, METRICS_PORT
+
+# Turn that spans recorded in the current context belong to
+current_turn: contextvars.ContextVar = contextvars.ContextVar("current_turn", default=None)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class Tracer:
+    def __init__(self, path: str = TRACE_FILE, enabled: bool = TRACE_ENABLED):
+        """Records spans and gauges to a rotating JSONL file and keeps recent values for /metrics."""
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=1000))  # Span name -> seconds
+        self.totals: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # Span name -> [count, sum]
+        self.gauges: Dict[tuple, float] = {}  # (name, label items) -> value
+        self.histograms: Dict[str, Dict[str, Any]] = {}  # Name -> bucket bounds, cumulative counts, sum
+        self.logger: Optional[logging.Logger] = None
+
+        if enabled:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=TRACE_MAX_MB * 1024 * 1024, backupCount=TRACE_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger = logging.getLogger("voice_assistant.trace")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            self.logger.addHandler(handler)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.logger is not None:
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+
+    def record(self, name: str, seconds: float, turn: Optional[int] = None, **attrs: Any) -> None:
+        """Record a span that was timed elsewhere."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.durations[name].append(seconds)
+            totals = self.totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+        self._write({
+            "time": time.time(), "type": "span", "name": name,
+            "turn": turn if turn is not None else current_turn.get(),
+            "ms": round(seconds * 1000, 2), **attrs
+        })
+
+    @contextmanager
+    def span(self, name: str, turn: Optional[int] = None, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """Time a block; the yielded dict can be filled with attributes while it runs."""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, time.perf_counter() - start, turn, **attrs)
+
+    def gauge(self, name: str, value: float, **attrs: Any) -> None:
+        """Record the current value of a queue depth, counter or similar."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, tuple(sorted(attrs.items())))] = value
+        self._write({"time": time.time(), "type": "gauge", "name": name, "value": value, **attrs})
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...]) -> None:
+        """Add a value to a histogram; the buckets are fixed by the first observation."""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {"buckets": buckets, "counts": [0] * (len(buckets) + 1), "sum": 0.0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["counts"][-1] += 1  # +Inf bucket doubles as the total count
+            histogram["sum"] += value
+        self._write({"time": time.time(), "type": "observation", "name": name, "value": value})
+
+    def prometheus_text(self) -> str:
+        """Current metrics in the Prometheus text exposition format."""
+        lines = ["# TYPE voice_assistant_span_seconds summary"]
+        with self.lock:
+            for name, values in sorted(self.durations.items()):
+                ordered = sorted(values)
+                for q in QUANTILES:
+                    lines.append(f'voice_assistant_span_seconds{{span="{name}",quantile="{q}"}} {percentile(ordered, q):.6f}')
+                count, total = self.totals[name]
+                lines.append(f'voice_assistant_span_seconds_count{{span="{name}"}} {count}')
+                lines.append(f'voice_assistant_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append("# TYPE voice_assistant_gauge gauge")
+            for (name, labels), value in sorted(self.gauges.items()):
+                label_text = "".join(f',{key}="{val}"' for key, val in labels)
+                lines.append(f'voice_assistant_gauge{{name="{name}"{label_text}}} {value}')
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE voice_assistant_{name} histogram")
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    lines.append(f'voice_assistant_{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'voice_assistant_{name}_bucket{{le="+Inf"}} {histogram["counts"][-1]}')
+                lines.append(f'voice_assistant_{name}_sum {histogram["sum"]:.6f}')
+                lines.append(f'voice_assistant_{name}_count {histogram["counts"][-1]}')
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port: int = METRICS_PORT) -> None:
+        """Serve /metrics on localhost in a background thread; a port of 0 disables it."""
+        if not self.enabled or not port:
+            return
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Keep scrapes out of the console
+
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        except OSError as e:
+            print(f"[TRACE] Could not serve metrics on port {port}: {e}")
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"[TRACE] Metrics at http://127.0.0.1:{port}/metrics")
+
+tracer = Tracer()
+
+def summarize(path: str) -> Dict[str, Dict[str, float]]:
+    """Per-span count and p50/p95/p99 in milliseconds from a trace file and its rotated backups."""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for file in sorted(glob.glob(path + ".*")) + [path]:
+        if not os.path.exists(file):
+            continue
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("type") == "span":
+                    durations[record["name"]].append(record["ms"])
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {"count": len(values), **{f"p{int(q * 100)}": percentile(values, q) for q in QUANTILES}}
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize stage latencies from a trace file.")
+    parser.add_argument("trace_file", nargs="?", default=TRACE_FILE)
+    args = parser.parse_args()
+
+    summary = summarize(args.trace_file)
+    if not summary:
+        print(f"No spans found in {args.trace_file}")
+        return
+    print(f"{'span':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for name, stats in sorted(summary.items()):
+        print(f"{name:<24}{stats['count']:>8}{stats['p50']:>12.1f}{stats['p95']:>12.1f}{stats['p99']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from config import TTS_BACKEND, TTS_CACHE_ENABLED, TTS_CACHE_DIR, TTS_CACHE_MAX_MB, OFFLINE_TTS_RATE
+
+class TTSBackend:
+    """Turns text into encoded audio bytes for a voice."""
+    name = "base"
+    extension = "mp3"
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        raise NotImplementedError
+
+class EdgeTTSBackend(TTSBackend):
+    """Microsoft Edge online voices through the edge-tts library, kept in-process.
+
+    Requests run on one long-lived event loop thread instead of spawning an
+    edge-tts process per response.
+    """
+    name = "edge"
+    extension = "mp3"
+
+    def __init__(self):
+        import edge_tts
+
+        self.edge_tts = edge_tts
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def _synthesize(self, text: str, voice: str) -> bytes:
+        audio = bytearray()
+        async for chunk in self.edge_tts.Communicate(text, voice).stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        return bytes(audio)
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        return asyncio.run_coroutine_threadsafe(self._synthesize(text, voice), self.loop).result()
+
+class OfflineTTSBackend(TTSBackend):
+    """Local synthesizer (pyttsx3: SAPI5 on Windows, espeak on Linux) that needs no network.
+
+    Uses the system default voice; the requested voice name only keys the cache.
+    """
+    name = "offline"
+    extension = "wav"
+
+    def __init__(self):
+        import pyttsx3
+
+        self.engine = pyttsx3.init()
+        self.engine.setProperty("rate", OFFLINE_TTS_RATE)
+        self.lock = threading.Lock()  # pyttsx3 engines are not thread-safe
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self.lock:
+                self.engine.save_to_file(text, path)
+                self.engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+# CUSTOMIZE: Register additional text-to-speech backends here
+BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend,
+    OfflineTTSBackend.name: OfflineTTSBackend,
+}
+
+class TTSCache:
+    def __init__(self, directory: str, max_bytes: int):
+        """Content-addressed audio cache on disk with size-bounded LRU eviction.
+
+        Files are named by a hash of (backend, voice, text). Recency is kept
+        in file modification times, so the LRU order survives restarts.
+        """
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # path -> size, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # Left over from an interrupted write
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self.entries[path] = size
+            self.total_bytes += size
+
+    def path_for(self, backend: str, voice: str, text: str, extension: str) -> str:
+        key = hashlib.sha256(f"{backend}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def contains(self, path: str) -> bool:
+        return os.path.dirname(path) == self.directory
+
+    def get(self, path: str) -> bool:
+        """Return True and mark the entry as recently used if it is cached."""
+        with self.lock:
+            if path in self.entries:
+                try:
+                    # Under the lock so a concurrent put() cannot evict the file in between
+                    os.utime(path)
+                    self.entries.move_to_end(path)
+                    self.hits += 1
+                    return True
+                except FileNotFoundError:
+                    self.total_bytes -= self.entries.pop(path)
+            self.misses += 1
+            return False
+
+    def put(self, path: str, audio: bytes) -> None:
+        """Store audio atomically, then evict least recently used entries over the size limit."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(audio)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.total_bytes -= self.entries.pop(path, 0)
+            self.entries[path] = len(audio)
+            self.total_bytes += len(audio)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_path, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass  # Locked by playback on Windows; picked up again by the next startup scan
+
+class TTSEngine:
+    def __init__(self, backend_name: str = TTS_BACKEND):
+        """Resident text-to-speech engine with an optional on-disk audio cache."""
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown TTS backend '{backend_name}'. Options: {', '.join(BACKENDS)}")
+        self.backend = BACKENDS[backend_name]()
+        self.cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 1024 * 1024) if TTS_CACHE_ENABLED else None
+
+    def synthesize_to_file(self, text: str, voice: str) -> Optional[str]:
+        """Return a playable audio file for text, synthesizing only on a cache miss."""
+        try:
+            if self.cache:
+                path = self.cache.path_for(self.backend.name, voice, text, self.backend.extension)
+                if self.cache.get(path):
+                    return path
+                audio = self.backend.synthesize(text, voice)
+                if not audio:
+                    raise RuntimeError("TTS backend returned no audio")
+                self.cache.put(path, audio)
+                return path
+
+            fd, path = tempfile.mkstemp(suffix=f".{self.backend.extension}")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.backend.synthesize(text, voice))
+            return path
+        except Exception as e:
+            print(f"[TTS] Error: {e}")
+            return None
+
+    def release(self, path: str) -> None:
+        """Delete a file returned by synthesize_to_file once played, unless it lives in the cache."""
+        if self.cache and self.cache.contains(path):
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,198 @@
+import numpy as np
+from typing import Optional, Tuple
+
+from config import (
+    SAMPLE_RATE,
+    FRAME_DURATION_MS,
+    VAD_BACKEND,
+    VAD_ENERGY_THRESHOLD_DB,
+    VAD_NOISE_MARGIN_DB,
+    VAD_MAX_ZCR,
+    VAD_WEBRTC_AGGRESSIVENESS,
+    VAD_MIN_SPEECH_MS,
+    VAD_SILENCE_TIMEOUT_MS,
+    VAD_PADDING_MS,
+    BARGE_IN_MIN_SPEECH_MS,
+    BARGE_IN_ECHO_MARGIN_DB,
+    BARGE_IN_ECHO_TAIL_MS,
+)
+
+FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
+
+def frame_features(samples: np.ndarray, frame_size: int = FRAME_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Return per-frame energy (dBFS) and zero-crossing rate for int16 samples.
+
+    All frames are analyzed at once by reshaping the signal into a
+    (frames, frame_size) matrix; a trailing partial frame is ignored.
+    """
+    count = len(samples) // frame_size
+    frames = np.array(samples[:count * frame_size], dtype=np.float32).reshape(count, frame_size)
+    frames /= 32768.0
+
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    energy_db = 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_size - 1)
+    return energy_db, zcr
+
+class VoiceActivityDetector:
+    def __init__(self):
+        """Classify 30 ms frames as speech or silence.
+
+        The default backend combines an adaptive energy threshold with a
+        zero-crossing limit to reject hiss. If VAD_BACKEND is "webrtc" and
+        the optional webrtcvad package is installed, its model is used instead.
+        """
+        self.noise_floor_db = VAD_ENERGY_THRESHOLD_DB - VAD_NOISE_MARGIN_DB
+        self.webrtc = None
+
+        if VAD_BACKEND == "webrtc":
+            try:
+                import webrtcvad
+                self.webrtc = webrtcvad.Vad(VAD_WEBRTC_AGGRESSIVENESS)
+            except ImportError:
+                print("[VAD] webrtcvad not installed. Using energy-based detection.")
+
+    def threshold_db(self) -> float:
+        """Current energy threshold, never below the configured minimum."""
+        return max(VAD_ENERGY_THRESHOLD_DB, self.noise_floor_db + VAD_NOISE_MARGIN_DB)
+
+    def classify(self, samples: np.ndarray) -> np.ndarray:
+        """Return a boolean speech mask with one entry per full frame."""
+        if self.webrtc is not None:
+            count = len(samples) // FRAME_SIZE
+            data = np.asarray(samples, dtype=np.int16)
+            return np.array([
+                self.webrtc.is_speech(data[i * FRAME_SIZE:(i + 1) * FRAME_SIZE].tobytes(), SAMPLE_RATE)
+                for i in range(count)
+            ], dtype=bool)
+
+        energy_db, zcr = frame_features(samples)
+        speech = (energy_db > self.threshold_db()) & (zcr < VAD_MAX_ZCR)
+
+        # Track the background level on silent frames so the threshold adapts
+        silent = energy_db[~speech]
+        if len(silent):
+            self.noise_floor_db = 0.95 * self.noise_floor_db + 0.05 * float(np.mean(silent))
+        return speech
+
+class Endpointer:
+    def __init__(self, detector: Optional[VoiceActivityDetector] = None):
+        """Track speech start/end over a recording and detect when the user stopped talking."""
+        self.detector = detector or VoiceActivityDetector()
+        self.min_speech_frames = max(1, VAD_MIN_SPEECH_MS // FRAME_DURATION_MS)
+        self.silence_frames_timeout = max(1, VAD_SILENCE_TIMEOUT_MS // FRAME_DURATION_MS)
+        self.padding = int(SAMPLE_RATE * VAD_PADDING_MS / 1000)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all state for a new recording."""
+        self.frames_seen = 0
+        self.speech_run = 0
+        self.silence_run = 0
+        self.speech_start_frame: Optional[int] = None
+        self.speech_end_frame: Optional[int] = None
+        self.endpoint_reached = False
+        self.remainder = np.zeros(0, dtype=np.int16)  # Samples short of a full frame, kept for the next call
+
+    @property
+    def speech_detected(self) -> bool:
+        return self.speech_start_frame is not None
+
+    def process(self, samples: np.ndarray) -> bool:
+        """Feed captured samples of any length; returns True once trailing silence exceeds the timeout.
+
+        Samples are analyzed in whole frames. A partial frame at the end is
+        carried over to the next call, so frame positions stay aligned with
+        the recording whatever the chunk size.
+        """
+        if len(self.remainder):
+            samples = np.concatenate([self.remainder, samples])
+        usable = len(samples) - len(samples) % FRAME_SIZE
+        self.remainder = np.array(samples[usable:], dtype=np.int16)
+        for is_speech in self.detector.classify(samples[:usable]):
+            if is_speech:
+                self.speech_run += 1
+                self.silence_run = 0
+                if self.speech_start_frame is None and self.speech_run >= self.min_speech_frames:
+                    self.speech_start_frame = self.frames_seen - self.speech_run + 1
+                if self.speech_start_frame is not None:
+                    self.speech_end_frame = self.frames_seen + 1
+            else:
+                self.speech_run = 0
+                self.silence_run += 1
+                if self.speech_detected and self.silence_run >= self.silence_frames_timeout:
+                    self.endpoint_reached = True
+            self.frames_seen += 1
+        return self.endpoint_reached
+
+    def speech_bounds(self, total_samples: int) -> Optional[Tuple[int, int]]:
+        """Return padded (start, end) sample indices of the detected speech, or None."""
+        if self.speech_start_frame is None:
+            return None
+        start = max(0, self.speech_start_frame * FRAME_SIZE - self.padding)
+        end = min(total_samples, self.speech_end_frame * FRAME_SIZE + self.padding)
+        return start, end
+
+class BargeInDetector:
+    def __init__(self, detector: Optional[VoiceActivityDetector] = None):
+        """Detect the user starting to talk over the assistant's own speech.
+
+        A frame counts as the user only if the VAD calls it speech and it is
+        BARGE_IN_ECHO_MARGIN_DB louder than the expected echo. The expected
+        echo is the loudest playback frame of the last BARGE_IN_ECHO_TAIL_MS,
+        scaled by the speaker-to-microphone coupling. This is a Geigel-style
+        double-talk test on frame energies. The coupling is learned from the
+        frames where only the assistant is heard. It starts pessimistic
+        (echo as loud as the playback) and is kept across turns.
+        """
+        self.detector = detector or VoiceActivityDetector()
+        self.min_speech_frames = max(1, BARGE_IN_MIN_SPEECH_MS // FRAME_DURATION_MS)
+        self.tail_seconds = BARGE_IN_ECHO_TAIL_MS / 1000
+        self.coupling_db = 0.0  # Microphone level minus playback level for pure echo
+        self.reset()
+
+    def reset(self) -> None:
+        self.speech_run = 0
+
+    @property
+    def speech_seconds(self) -> float:
+        """How long the current run of user speech has lasted."""
+        return self.speech_run * FRAME_DURATION_MS / 1000
+
+    def process(self, samples: np.ndarray, reference: np.ndarray, reference_rate: int) -> bool:
+        """Feed captured int16 samples and the float32 playback of the same period plus the echo tail.
+
+        Returns True once the user has talked over the playback for
+        BARGE_IN_MIN_SPEECH_MS.
+        """
+        energy_db, _ = frame_features(samples)
+        speech = self.detector.classify(samples)
+        reference_db, _ = frame_features(reference * 32768.0, int(reference_rate * FRAME_DURATION_MS / 1000))
+        playback_db = float(np.max(reference_db)) if len(reference_db) else -100.0
+        playing = playback_db > VAD_ENERGY_THRESHOLD_DB
+
+        for frame_db, is_speech in zip(energy_db, speech):
+            echo_db = playback_db + self.coupling_db
+            if is_speech and (not playing or frame_db > echo_db + BARGE_IN_ECHO_MARGIN_DB):
+                self.speech_run += 1
+                continue
+            self.speech_run = 0
+            if playing:
+                # Follow louder echo quickly and let the estimate sink slowly otherwise
+                observed = float(frame_db) - playback_db
+                if observed > self.coupling_db:
+                    self.coupling_db += 0.5 * (observed - self.coupling_db)
+                else:
+                    self.coupling_db = max(observed, self.coupling_db - 0.1)
+        return self.speech_run >= self.min_speech_frames
+
+def trim_silence(samples: np.ndarray) -> np.ndarray:
+    """Return samples with leading and trailing silence removed (empty if no speech)."""
+    endpointer = Endpointer()
+    endpointer.process(samples)
+    bounds = endpointer.speech_bounds(len(samples))
+    if bounds is None:
+        return samples[:0]
+    return samples[bounds[0]:bounds[1]]